@@ -0,0 +1,127 @@
+"""
+Micro-benchmark of the HTML extraction backends in ``collector.extract``.
+
+Parses every saved page in ``benchmarks/fixtures`` with each backend, collects
+every rule the fetchers use in one ``collect`` pass, and reports the median time
+per page. The
+incremental ``head`` parser is fed the page in network-sized chunks and only
+answers the <head> lookups; "head bytes" is how much of the page it needed.
+Exits non-zero if any backend extracts something different from BeautifulSoup.
+
+    python benchmarks/bench_extract.py [--repeat 50] [--fixtures DIR] [--json]
+"""
+import argparse
+import codecs
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from collector import extract, profiles
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+REFERENCE_BACKEND = "soup"
+# Every image rule of every platform, plus the display name lookups.
+RULES = list(dict.fromkeys(
+    [rule for config in profiles.PLATFORMS.values() for rule in config["image_rules"]] + profiles.NAME_RULES
+))
+# What the incremental parser can answer from <head> alone.
+HEAD_KINDS = {"meta", "icon", "json_ld", "json_ld_image", "title"}
+# Fills the templates of img_alt rules.
+CONTEXT = {"username": "benchuser"}
+HEAD_CHUNK_SIZE = 1024
+
+
+def available_backends():
+    backends = ["soup", "regex", "head"]
+    if extract.lxml:
+        backends.insert(1, "lxml")
+    return backends
+
+
+def read_head(text):
+    """Feeds ``text`` to a HeadDocument chunk by chunk, as ``http_client.get_head`` does."""
+    doc = extract.HeadDocument()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    data = text.encode("utf-8")
+    for start in range(0, len(data), HEAD_CHUNK_SIZE):
+        chunk = data[start:start + HEAD_CHUNK_SIZE]
+        doc.bytes_read += len(chunk)
+        if doc.feed(decoder.decode(chunk)):
+            break
+    return doc
+
+
+def extract_all(text, backend):
+    """Parses ``text`` and returns every value the fetchers would read from it."""
+    if backend == "head":
+        found = read_head(text).collect(RULES, **CONTEXT)
+        return {_label(rule): found.get(rule) for rule in RULES if rule[0] in HEAD_KINDS}
+    found = extract.parse_html(text, backend).collect(RULES, **CONTEXT)
+    return {_label(rule): found.get(rule) for rule in RULES}
+
+
+def _label(rule):
+    kind, arg = rule
+    if arg is None:
+        return kind
+    return f"{kind}:{arg if isinstance(arg, str) else ','.join(arg)}"
+
+
+def time_backend(text, backend, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extract_all(text, backend)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="directory of saved .html pages")
+    parser.add_argument("--repeat", type=int, default=50, help="timed runs per page and backend")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    backends = available_backends()
+    results = []
+    mismatches = []
+    for path in sorted(glob.glob(os.path.join(args.fixtures, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        expected = extract_all(text, REFERENCE_BACKEND)
+        page = {
+            "page": os.path.basename(path),
+            "bytes": len(text.encode("utf-8")),
+            "head_bytes": read_head(text).bytes_read,
+            "ms": {},
+        }
+        for backend in backends:
+            got = extract_all(text, backend)
+            for key in got:
+                if got[key] != expected[key]:
+                    mismatches.append((page["page"], backend, key, expected[key], got[key]))
+            page["ms"][backend] = time_backend(text, backend, args.repeat)
+        results.append(page)
+
+    if args.json:
+        print(json.dumps({"backends": backends, "pages": results, "mismatches": len(mismatches)}, indent=2))
+    else:
+        print(f"{'page':<28}{'bytes':>8}{'head bytes':>12}" + "".join(f"{backend + ' ms':>12}" for backend in backends))
+        for page in results:
+            sizes = f"{page['page']:<28}{page['bytes']:>8}{page['head_bytes']:>12}"
+            print(sizes + "".join(f"{page['ms'][b]:>12.3f}" for b in backends))
+        for page, backend, key, expected, got in mismatches:
+            print(f"MISMATCH {page} [{backend}] {key}: expected {expected!r}, got {got!r}", file=sys.stderr)
+        if not mismatches:
+            print(f"All backends agree on {len(results)} pages.")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
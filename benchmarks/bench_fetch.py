@@ -0,0 +1,239 @@
+"""
+Throughput benchmark of the fetchers against the local stub web (``stubweb.py``).
+
+Each target runs in its own subprocess, inside a fresh temporary directory, so
+caches start cold and peak RSS belongs to that target alone:
+
+* ``profiles``        - ``collector.profiles.fetch_profile``, which both apps'
+                        ``fetch_profile_image`` wrap; a share of queries go through search
+* ``substack_direct`` - ``collector.fetchers.fetch_substack_profile_image``
+* ``medium_direct``   - ``collector.fetchers.fetch_medium_profile_image``
+* ``zip``             - ``collector.export.zip_images`` over the saved images, cold then warm
+
+Reports p50/p95/p99 latency, profiles/sec and peak RSS as JSON, and with
+``--baseline`` the change against an earlier run's JSON.
+
+    python benchmarks/bench_fetch.py [--profiles 200] [--concurrency 8] [--latency-ms 20]
+        [--error-rate 0.01] [--seed 0] [--targets profiles,zip] [--output run.json]
+        [--baseline previous.json]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = ["profiles", "substack_direct", "medium_direct", "zip"]
+# Metrics compared against a baseline; counts are not. Higher is better only for throughput.
+COMPARED = {"p50", "p95", "p99", "mean", "wall_s", "profiles_per_sec", "peak_rss_mb", "cold_ms", "warm_ms"}
+HIGHER_IS_BETTER = {"profiles_per_sec"}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, failures, wall):
+    latencies_ms = [latency * 1000 for latency in latencies]
+    return {
+        "count": len(latencies) + failures,
+        "ok": len(latencies),
+        "failed": failures,
+        "wall_s": round(wall, 3),
+        "profiles_per_sec": round(len(latencies) / wall, 2) if wall else None,
+        "latency_ms": {
+            "p50": _round(percentile(latencies_ms, 50)),
+            "p95": _round(percentile(latencies_ms, 95)),
+            "p99": _round(percentile(latencies_ms, 99)),
+            "mean": _round(statistics.fmean(latencies_ms)) if latencies_ms else None,
+        },
+    }
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def timed_matrix(jobs, fn, concurrency):
+    """Runs ``fn(*job)`` for every job on the fetch engine; returns (latencies, failures, wall seconds)."""
+    from collector.engine import fetch_matrix
+
+    def timed(job, _):
+        start = time.perf_counter()
+        ok = fn(*job)
+        return time.perf_counter() - start, ok
+
+    latencies, failures = [], 0
+    start = time.perf_counter()
+    for _, _, (latency, ok) in fetch_matrix(jobs, [None], timed, concurrency=concurrency):
+        if ok:
+            latencies.append(latency)
+        else:
+            failures += 1
+    return latencies, failures, time.perf_counter() - start
+
+
+def run_target(target, args):
+    """Runs one target in this process (already inside its temp directory) and returns its report."""
+    import stubweb
+    from collector import export, fetchers, metrics, profiles
+    from collector.image_store import get_store
+
+    with stubweb.StubWeb(latency_ms=args.latency_ms, error_rate=args.error_rate, seed=args.seed) as stub:
+        stubweb.install(stub, rate_limits=args.rate_limits)
+        users = [f"benchuser{i:05d}" for i in range(args.profiles)]
+
+        if target == "profiles":
+            # Every `search_every`-th query is a display name, which has to go through search.
+            jobs = []
+            for i, user in enumerate(users):
+                query = f"Bench User {i:05d}" if args.search_every and i % args.search_every == 0 else user
+                jobs.append((query, "medium" if i % 2 else "substack"))
+            report = summarize(*timed_matrix(
+                [tuple(job) for job in jobs],
+                lambda query, platform: profiles.fetch_profile(query, platform, "images") is not None,
+                args.concurrency,
+            ))
+            # Where the time went, from the pipeline's own stage timings.
+            report["stage_mean_ms"] = {
+                f"{stage['platform']}.{stage['stage']}": round(stage["mean"] * 1000, 2)
+                for stage in metrics.snapshot()["stages"]
+            }
+        elif target == "substack_direct":
+            report = summarize(*timed_matrix(
+                [(user,) for user in users],
+                lambda user: fetchers.fetch_substack_profile_image(user, "images")[0] is not None,
+                args.concurrency,
+            ))
+        elif target == "medium_direct":
+            report = summarize(*timed_matrix(
+                [(user,) for user in users],
+                lambda user: fetchers.fetch_medium_profile_image(user, "images")[0] is not None,
+                args.concurrency,
+            ))
+        elif target == "zip":
+            store = get_store("images")
+            filepaths = [
+                store.save_bytes(stubweb.avatar_bytes(user), f"zip_{user}.jpg") for user in users
+            ]
+            report = {}
+            for phase in ("cold", "warm"):
+                start = time.perf_counter()
+                zip_path = export.zip_images(filepaths, digest_for=store.digest_for)
+                report[f"{phase}_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            report["files"] = len(filepaths)
+            report["archive_bytes"] = os.path.getsize(zip_path)
+        else:
+            raise ValueError(f"unknown target {target!r}")
+
+        report["stub_requests"] = stub.requests
+        report["stub_errors"] = stub.errors
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def spawn(target, args):
+    """Runs ``target`` in a child process inside a fresh temp directory and returns its report."""
+    command = [
+        sys.executable, os.path.abspath(__file__), "--run-target", target,
+        "--profiles", str(args.profiles), "--concurrency", str(args.concurrency),
+        "--latency-ms", str(args.latency_ms), "--error-rate", str(args.error_rate),
+        "--seed", str(args.seed), "--search-every", str(args.search_every),
+    ]
+    if args.rate_limits:
+        command.append("--rate-limits")
+    with tempfile.TemporaryDirectory(prefix=f"bench_{target}_") as workdir:
+        # A cold cache of its own: the collector keeps its caches under COLLECTOR_CACHE_DIR.
+        env = dict(os.environ, COLLECTOR_CACHE_DIR=os.path.join(workdir, ".cache"))
+        completed = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+    if completed.returncode:
+        return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"}
+    return json.loads(completed.stdout)
+
+
+def compare(current, baseline):
+    """Relative change of each ``COMPARED`` metric against ``baseline``; negative is worse."""
+    changes = {}
+    for target, report in current["results"].items():
+        old = baseline.get("results", {}).get(target)
+        if not old:
+            continue
+        for key, value, old_value in _pairs(report, old):
+            metric = key.rsplit(".", 1)[-1]
+            if metric in COMPARED and old_value:
+                change = (value - old_value) / old_value
+                changes[f"{target}.{key}"] = round(change if metric in HIGHER_IS_BETTER else -change, 3)
+    return changes
+
+
+def _pairs(report, old, prefix=""):
+    for key, value in report.items():
+        if isinstance(value, dict):
+            yield from _pairs(value, old.get(key) or {}, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and isinstance(old.get(key), (int, float)):
+            yield f"{prefix}{key}", value, old[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--profiles", type=int, default=200, help="lookups (or files, for zip) per target")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=20, help="mean injected latency per stub response")
+    parser.add_argument("--error-rate", type=float, default=0.01, help="share of stub responses replaced by a 503")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--search-every", type=int, default=5, help="every Nth profiles query needs a web search (0: none)")
+    parser.add_argument("--rate-limits", action="store_true", help="keep the real per-host rate limits")
+    parser.add_argument("--targets", default=",".join(TARGETS), help="comma-separated subset of: " + ", ".join(TARGETS))
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--run-target", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_target:
+        print(json.dumps(run_target(args.run_target, args)))
+        return 0
+
+    report = {
+        "config": {
+            key: getattr(args, key)
+            for key in ("profiles", "concurrency", "latency_ms", "error_rate", "seed", "search_every", "rate_limits")
+        },
+        "python": platform.python_version(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": {},
+    }
+    for target in [target.strip() for target in args.targets.split(",") if target.strip()]:
+        report["results"][target] = spawn(target, args)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["change_vs_baseline"] = compare(report, json.load(f))
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 1 if any("error" in result for result in report["results"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Latency and memory benchmark of the PDF splitter against document size.
+
+For each page count a synthetic PDF (text content on every page) is built,
+then each mode runs in its own subprocess so peak RSS belongs to it alone:
+
+* ``reparse`` - what ``project_2/pdf.py`` used to do: a new ``PdfReader`` over
+                the upload bytes on every rerun, output to a ``BytesIO``
+* ``cached``  - ``collector.pdf_split.PdfDocument``: parsed once from the
+                spooled file, pages loaded on demand, output spooled
+
+Reports ``open_ms`` (first parse), ``rerun_ms`` (the median cost of one more
+Streamlit rerun, before any split), ``split_ms`` (keeping the first half of
+the pages), ``resplit_ms`` (clicking split again, rerun included) and
+``peak_rss_mb``.
+
+    python benchmarks/bench_pdf.py [--pages 10,100,500,2000] [--reruns 5] [--json]
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = ["reparse", "cached"]
+# Text drawn on every page, so page count and file size grow together.
+PAGE_TEXT = "The quick brown fox jumps over the lazy dog. " * 40
+
+
+def make_pdf(path, pages):
+    from PyPDF2 import PdfWriter
+    from PyPDF2.generic import DecodedStreamObject, NameObject
+
+    writer = PdfWriter()
+    for number in range(pages):
+        page = writer.add_blank_page(612, 792)
+        content = DecodedStreamObject()
+        lines = " ".join(f"({PAGE_TEXT[i:i + 80]} {number}) Tj T*" for i in range(0, len(PAGE_TEXT), 80))
+        content.set_data(f"BT /F1 10 Tf 12 TL 36 756 Td {lines} ET".encode())
+        page[NameObject("/Contents")] = writer._add_object(content)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def run_mode(mode, path, reruns):
+    """Runs one mode in this process (already inside its temp directory) and returns its report."""
+    from PyPDF2 import PdfReader, PdfWriter
+    from collector.pdf_split import PdfDocument, content_hash
+
+    with open(path, "rb") as f:
+        data = f.read()
+    report = {}
+    rerun_times = []
+    if mode == "reparse":
+        def open_pdf():
+            reader = PdfReader(io.BytesIO(data))
+            return reader, len(reader.pages)
+
+        def split(reader, pages):
+            writer = PdfWriter()
+            for i in range(pages):
+                writer.add_page(reader.pages[i])
+            output = io.BytesIO()
+            writer.write(output)
+
+        start = time.perf_counter()
+        reader, total = open_pdf()
+        report["open_ms"] = _ms(start)
+        for _ in range(reruns):
+            start = time.perf_counter()
+            reader, total = open_pdf()
+            rerun_times.append(_ms(start))
+        start = time.perf_counter()
+        split(reader, total // 2 or 1)
+        report["split_ms"] = _ms(start)
+        # Clicking split again is another rerun: parse, count, split.
+        start = time.perf_counter()
+        reader, total = open_pdf()
+        split(reader, total // 2 or 1)
+        report["resplit_ms"] = _ms(start)
+    elif mode == "cached":
+        documents = {}
+        start = time.perf_counter()
+        digest = content_hash(data)
+        documents[digest] = PdfDocument.from_bytes(data, digest)
+        total = documents[digest].page_count
+        report["open_ms"] = _ms(start)
+        for _ in range(reruns):
+            # The app keeps the digest per upload, so a rerun is a cache lookup.
+            start = time.perf_counter()
+            total = documents[digest].page_count
+            rerun_times.append(_ms(start))
+        # The first split resolves the page tree; later ones reuse it.
+        for key in ("split_ms", "resplit_ms"):
+            start = time.perf_counter()
+            with documents[digest].write_pages(range(total // 2 or 1)):
+                pass
+            report[key] = _ms(start)
+    else:
+        raise ValueError(f"unknown mode {mode!r}")
+    report["rerun_ms"] = statistics.median(rerun_times) if rerun_times else None
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def spawn(mode, path, reruns):
+    """Runs ``mode`` in a child process inside a fresh temp directory and returns its report."""
+    command = [sys.executable, os.path.abspath(__file__), "--run-mode", mode, "--pdf", path, "--reruns", str(reruns)]
+    with tempfile.TemporaryDirectory(prefix=f"bench_pdf_{mode}_") as workdir:
+        # A cold cache of its own: the collector keeps its caches under COLLECTOR_CACHE_DIR.
+        env = dict(os.environ, COLLECTOR_CACHE_DIR=os.path.join(workdir, ".cache"))
+        completed = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+    if completed.returncode:
+        return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"}
+    return json.loads(completed.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", default="10,100,500,2000", help="comma-separated page counts to test")
+    parser.add_argument("--reruns", type=int, default=5, help="simulated Streamlit reruns per upload")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--run-mode", help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        print(json.dumps(run_mode(args.run_mode, args.pdf, args.reruns)))
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_pdf_") as workdir:
+        for pages in [int(count) for count in args.pages.split(",") if count.strip()]:
+            path = os.path.join(workdir, f"{pages}.pdf")
+            make_pdf(path, pages)
+            for mode in MODES:
+                results.append(dict(pages=pages, mb=round(os.path.getsize(path) / 2 ** 20, 2), mode=mode,
+                                    **spawn(mode, path, args.reruns)))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        columns = ["pages", "mb", "mode", "open_ms", "rerun_ms", "split_ms", "resplit_ms", "peak_rss_mb"]
+        print(" ".join(f"{column:>11}" for column in columns))
+        for row in results:
+            if "error" in row:
+                print(f"{row['pages']:>11} {row['mb']:>11} {row['mode']:>11}  error: {row['error']}")
+                continue
+            print(" ".join(f"{row[column]!s:>11}" for column in columns))
+    return 1 if any("error" in row for row in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
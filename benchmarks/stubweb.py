@@ -0,0 +1,212 @@
+"""
+A local stand-in for Medium, Substack, their image CDNs and DuckDuckGo search.
+
+``StubWeb`` is a threaded HTTP server that replays the recorded pages in
+``benchmarks/fixtures``, with the recorded user's handle and avatar ids
+swapped for the requested user's. Image URLs return a small JPEG generated
+deterministically from the URL. Every response can be delayed by an injected
+latency and replaced by a 503 at an injected error rate, both drawn from a
+seeded RNG so runs are repeatable.
+
+``install`` points the shared ``http_client`` session at the server (the
+original host travels in ``X-Stub-Host``), swaps DuckDuckGo for
+``StubDDGS``, and can lift the per-host rate limits so the benchmark measures
+the code rather than the configured pacing.
+"""
+import hashlib
+import http.server
+import io
+import os
+import random
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+from PIL import Image, ImageDraw
+from requests.adapters import HTTPAdapter
+
+from collector import http_client, image_search, profiles, ratelimit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+# Per platform: the recorded page, and the recorded strings that identify its user.
+RECORDINGS = {
+    "medium": ("medium_profile.html", {"jordan_gibbs": "{user}", "Z4xbQ3E9aCqV0QvK6v7nrw": "{token}"}),
+    "substack": ("substack_home.html", {"stratechery": "{user}", "6f2c1a": "{token}", "ben.jpeg": "{token}.jpeg"}),
+}
+AVATAR_SIZE = 400
+STUB_HOST_HEADER = "X-Stub-Host"
+
+
+def _token(user):
+    return hashlib.sha256(user.encode("utf-8")).hexdigest()[:22]
+
+
+def avatar_bytes(seed):
+    """A distinct but deterministic JPEG for ``seed``: random blocks, so perceptual hashes differ."""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (AVATAR_SIZE, AVATAR_SIZE), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(AVATAR_SIZE), rng.randrange(AVATAR_SIZE)
+        size = rng.randrange(40, 200)
+        draw.rectangle([x, y, x + size, y + size], fill=tuple(rng.randrange(256) for _ in range(3)))
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=85)
+    return out.getvalue()
+
+
+class StubWeb:
+    """The stub server; use as a context manager, or ``start()``/``stop()``."""
+
+    def __init__(self, latency_ms=0, error_rate=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._pages = {}
+        for platform, (filename, _) in RECORDINGS.items():
+            with open(os.path.join(FIXTURES_DIR, filename), encoding="utf-8") as f:
+                self._pages[platform] = f.read()
+        self._avatars = {}
+        self.requests = 0
+        self.errors = 0
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="stubweb", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _draw(self):
+        """Returns (delay seconds, inject an error?) for one request."""
+        with self._rng_lock:
+            self.requests += 1
+            delay = self.latency_ms / 1000 * self._rng.uniform(0.5, 1.5) if self.latency_ms else 0
+            error = self._rng.random() < self.error_rate
+            self.errors += error
+        return delay, error
+
+    def page(self, platform, user):
+        text = self._pages[platform]
+        for recorded, replacement in RECORDINGS[platform][1].items():
+            text = text.replace(recorded, replacement.format(user=user, token=_token(user)))
+        return text.encode("utf-8")
+
+    def avatar(self, key):
+        if key not in self._avatars:
+            self._avatars[key] = avatar_bytes(key)
+        return self._avatars[key]
+
+    def route(self, host, path):
+        """Returns (status, content type, body) for a request to ``host`` + ``path``."""
+        if host == "medium.com":
+            match = re.match(r"/@([^/?]+)", path)
+            if match:
+                return 200, "text/html; charset=utf-8", self.page("medium", match.group(1))
+        elif host.endswith(".substack.com"):
+            return 200, "text/html; charset=utf-8", self.page("substack", host.split(".")[0])
+        elif re.search(r"\.(jpe?g|png|gif|webp)$", path.split("?")[0], re.IGNORECASE) or "/image/" in path:
+            return 200, "image/jpeg", self.avatar(host + path)
+        return 404, "text/plain", b"not found"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                delay, error = stub._draw()
+                if delay:
+                    time.sleep(delay)
+                if error:
+                    status, content_type, body = 503, "text/plain", b"injected error"
+                else:
+                    host = self.headers.get(STUB_HOST_HEADER) or self.headers.get("Host", "")
+                    status, content_type, body = stub.route(host.split(":")[0].lower(), self.path)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class StubAdapter(HTTPAdapter):
+    """Sends every request to the stub server, keeping the real URL on the response."""
+
+    def __init__(self, port, **kwargs):
+        self.port = port
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        url = urlparse(request.url)
+        stubbed = request.copy()
+        stubbed.url = url._replace(scheme="http", netloc=f"127.0.0.1:{self.port}").geturl()
+        stubbed.headers[STUB_HOST_HEADER] = url.hostname or ""
+        response = super().send(stubbed, **kwargs)
+        response.url = request.url
+        response.request = request
+        return response
+
+
+class StubDDGS:
+    """Answers ``text``/``images`` searches with stub-web URLs, after the injected latency."""
+
+    latency_ms = 0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def _wait(self):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def text(self, keywords, max_results=10):
+        self._wait()
+        name = re.search(r'"([^"]+)"', keywords)
+        slug = re.sub(r"\W+", "", (name.group(1) if name else keywords).lower())
+        if "substack" in keywords.lower():
+            return [{"href": f"https://{slug}.substack.com/archive", "title": slug}][:max_results]
+        return [{"href": f"https://medium.com/@{slug}", "title": slug}][:max_results]
+
+    def images(self, keywords, max_results=10):
+        self._wait()
+        slug = re.sub(r"\W+", "-", keywords.lower())
+        return [{"image": f"https://images.stub/{slug}/{i}.jpg"} for i in range(max_results)]
+
+
+def install(stub, rate_limits=False):
+    """Routes ``http_client`` and DuckDuckGo to ``stub``; without ``rate_limits`` no host is paced."""
+    session = http_client.get_session()
+    adapter = StubAdapter(stub.port, pool_connections=http_client.POOL_CONNECTIONS, pool_maxsize=http_client.POOL_MAXSIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    StubDDGS.latency_ms = stub.latency_ms
+    profiles.DDGS = StubDDGS
+    image_search.DDGS = StubDDGS
+    if not rate_limits:
+        unlimited = ratelimit.HostLimiter(rate=1e9, burst=1e9, max_concurrency=10 ** 6)
+        ratelimit.get_limiter = lambda key: unlimited
@@ -0,0 +1,9 @@
+"""Shared building blocks for the profile image collector apps."""
+import os
+
+# Caches, queues and spooled files, shared by every app and CLI run wherever it is
+# started from: the repository's .cache unless COLLECTOR_CACHE_DIR names another directory.
+CACHE_ROOT = os.path.abspath(
+    os.environ.get("COLLECTOR_CACHE_DIR")
+    or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache")
+)
@@ -0,0 +1,192 @@
+"""
+Batch profile lookups without a browser session.
+
+    python -m collector [--input names.jsonl] [--output results.jsonl] \\
+        [--platform substack --platform medium] [--concurrency 8] [--save-folder images]
+
+Input is JSONL: one object per line with a ``query`` (or ``name``/``url``) key, or a
+bare JSON string. Plain text lines are taken as queries too. Reads stdin when
+``--input`` is omitted. One result line is written per query and platform, in input
+order, as soon as it is ready.
+
+With ``--batch NAME`` the lookups go through the resumable job queue instead
+(``collector.jobs``). ``--input`` (``-`` for stdin) adds queries to the batch, then
+the process works the batch until nothing is left to claim, writing each result
+it finishes. Start more processes with the same ``--batch`` and no input to add
+workers. Rerun after a crash to resume, and use ``--results`` to print everything
+the batch has finished so far, in input order:
+
+    python -m collector --batch authors --input names.jsonl --concurrency 8
+    python -m collector --batch authors --concurrency 8        # another worker
+    python -m collector --batch authors --results > results.jsonl
+
+``--metrics FILE`` writes the run's stage timings and counters (``collector.metrics``)
+when it finishes: Prometheus text, or JSON if FILE ends in ``.json``.
+"""
+import argparse
+import json
+import logging
+import sys
+
+from collector import jobs, metrics
+from collector.engine import DEFAULT_CONCURRENCY, fetch_matrix
+from collector.profiles import HEDGE_DELAY, PLATFORMS, SAVE_FOLDER, fetch_profile
+
+logger = logging.getLogger("collector")
+
+_LOG_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "success": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+}
+
+
+def read_queries(lines):
+    """Yields the query on each non-blank input line."""
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            record = line
+        if isinstance(record, dict):
+            record = record.get("query") or record.get("name") or record.get("url")
+        if not isinstance(record, str) or not record.strip():
+            logger.warning("Skipping line %d: no query found", number)
+            continue
+        yield record.strip()
+
+
+def lookup(query, platform, save_folder, hedge_delay=HEDGE_DELAY):
+    """Runs one lookup and returns its JSONL record; a failed one carries its last event as ``error``."""
+    messages = []
+
+    def on_event(level, message):
+        logger.log(_LOG_LEVELS[level], "[%s/%s] %s", platform, query, message)
+        messages.append(message)
+
+    try:
+        result = fetch_profile(query, platform, save_folder, on_event=on_event, hedge_delay=hedge_delay)
+    except Exception as e:
+        logger.exception("[%s/%s] Unexpected error", platform, query)
+        messages.append(f"{type(e).__name__}: {e}")
+        result = None
+    record = {"query": query, "platform": platform, "ok": result is not None}
+    if result:
+        record.update(result)
+    elif messages:
+        record["error"] = messages[-1]
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m collector", description="Batch profile image lookups.")
+    parser.add_argument("--input", "-i", type=argparse.FileType("r", encoding="utf-8"),
+                        help="JSONL file of names/URLs, - for stdin (default: stdin, or none with --batch)")
+    parser.add_argument("--output", "-o", type=argparse.FileType("w", encoding="utf-8"), default=sys.stdout,
+                        help="where to write JSONL results (default: stdout)")
+    parser.add_argument("--platform", "-p", action="append", choices=sorted(PLATFORMS),
+                        help="platform to search; repeat for several (default: all)")
+    parser.add_argument("--concurrency", "-c", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"lookups run at once (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--save-folder", default=SAVE_FOLDER, help=f"where images are saved (default: {SAVE_FOLDER})")
+    parser.add_argument("--hedge-delay", type=float, default=HEDGE_DELAY,
+                        help=f"seconds a username's usual address gets before a search starts alongside it (default: {HEDGE_DELAY:g})")
+    parser.add_argument("--no-hedge", dest="hedge_delay", action="store_const", const=None,
+                        help="only search once the usual address turns out to be missing")
+    parser.add_argument("--batch", "-b", help="run through the resumable job queue as this named batch")
+    parser.add_argument("--jobs-db", default=jobs.DB_PATH, help=f"job queue file for --batch (default: {jobs.DB_PATH})")
+    parser.add_argument("--results", action="store_true", help="with --batch: print the batch's finished results and exit")
+    parser.add_argument("--retry-failed", action="store_true", help="with --batch: requeue tasks that used up their attempts")
+    parser.add_argument("--metrics", help="write stage timings and counters here at the end (.json for JSON, else Prometheus text)")
+    parser.add_argument("--verbose", "-v", action="count", default=0, help="log progress to stderr (-vv for debug)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=[logging.WARNING, logging.INFO, logging.DEBUG][min(args.verbose, 2)],
+        format="%(asctime)s %(levelname)s %(message)s",
+        stream=sys.stderr,
+    )
+    try:
+        if args.batch:
+            return run_batch(args)
+        return run_lookups(args)
+    finally:
+        if args.metrics:
+            write_metrics(args.metrics)
+
+
+def run_lookups(args):
+    """Runs every input query on every platform and writes the results in input order."""
+    # Drop repeats so two workers never write the same file at once.
+    queries = list(dict.fromkeys(read_queries(args.input or sys.stdin)))
+    platforms = args.platform or list(PLATFORMS)
+
+    found = 0
+    results = fetch_matrix(
+        queries,
+        platforms,
+        lambda query, platform: lookup(query, platform, args.save_folder, args.hedge_delay),
+        concurrency=args.concurrency,
+    )
+    for query, platform, record in results:
+        found += record["ok"]
+        args.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        args.output.flush()
+    logger.info("Saved %d image(s) for %d lookup(s)", found, len(queries) * len(platforms))
+    return 0
+
+
+def run_batch(args):
+    """``--batch`` mode: enqueue any input, then work the batch or print its results."""
+    job_queue = jobs.JobQueue(args.jobs_db)
+    if args.input:
+        queries = list(dict.fromkeys(read_queries(args.input)))
+        batch_id = job_queue.add_batch(args.batch, queries, args.platform or list(PLATFORMS))
+    else:
+        batch_id = job_queue.batch_id(args.batch)
+        if batch_id is None:
+            logger.error("No batch named %r; pass --input to create it", args.batch)
+            return 2
+    if args.retry_failed:
+        job_queue.retry_failed(batch_id)
+
+    if args.results:
+        for task in job_queue.results(batch_id):
+            args.output.write(json.dumps(_task_record(task), ensure_ascii=False) + "\n")
+        return 0
+
+    results = jobs.work(
+        job_queue,
+        lambda query, platform: lookup(query, platform, args.save_folder, args.hedge_delay),
+        batch_id=batch_id,
+        concurrency=args.concurrency,
+    )
+    for task, record in results:
+        args.output.write(json.dumps(record or _task_record(task), ensure_ascii=False) + "\n")
+        args.output.flush()
+    progress = job_queue.progress(batch_id)
+    logger.info("Batch %s: %s", args.batch, ", ".join(f"{count} {state}" for state, count in progress.items()))
+    return 0
+
+
+def write_metrics(path):
+    with open(path, "w", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            json.dump(metrics.snapshot(), f, indent=2)
+        else:
+            f.write(metrics.prometheus_text())
+
+
+def _task_record(task):
+    if task["result"]:
+        return task["result"]
+    return {"query": task["query"], "platform": task["platform"], "ok": False, "error": task["error"]}
+
+
+if __name__ == "__main__":
+    sys.exit(main())
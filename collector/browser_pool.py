@@ -0,0 +1,110 @@
+"""
+Pool of long-lived, already-authenticated headless Chrome drivers.
+
+Starting Chrome and logging it in with the ``li_at`` cookie costs several
+seconds, so drivers are kept warm and reused across profile URLs. A driver
+is recycled after ``max_pages`` pages, or straight away if it crashes.
+"""
+import atexit
+import queue
+import threading
+
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+LINKEDIN_HOME = "https://www.linkedin.com"
+PROFILE_IMAGE_CLASSES = [
+    "profile-photo-edit__preview",
+    "pv-top-card-profile-picture__image",
+    "ivm-view-attr__img--centered",
+    "artdeco-entity-image",
+]
+PROFILE_IMAGE_SELECTOR = ", ".join(f"img[class*='{cls}']" for cls in PROFILE_IMAGE_CLASSES)
+
+
+class DriverPool:
+    """Hands out warm Chrome drivers logged in with ``li_at``, at most ``size`` at a time."""
+
+    def __init__(self, li_at, size=2, max_pages=50, wait_timeout=10):
+        self.li_at = li_at
+        self.max_pages = max_pages
+        self.wait_timeout = wait_timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+        atexit.register(self.close)
+
+    def _new_driver(self):
+        chrome_options = Options()
+        chrome_options.add_argument("--headless=new")
+        chrome_options.add_argument("--disable-gpu")
+        chrome_options.add_argument("--no-sandbox")
+        driver = webdriver.Chrome(service=Service(), options=chrome_options)
+        try:
+            # The cookie can only be set once a linkedin.com page is loaded; get() blocks until it is.
+            driver.get(LINKEDIN_HOME)
+            driver.add_cookie({"name": "li_at", "value": self.li_at, "domain": ".linkedin.com"})
+        except WebDriverException:
+            driver.quit()
+            raise
+        return driver
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._new_driver(), 0
+
+    def _checkin(self, driver, pages):
+        if self._closed or pages >= self.max_pages:
+            _quit(driver)
+        else:
+            self._idle.put((driver, pages))
+
+    def page_source(self, url, wait_selector=PROFILE_IMAGE_SELECTOR):
+        """
+        Loads ``url`` and returns the page source once ``wait_selector`` is present,
+        or after ``wait_timeout`` seconds if it never shows up. A crashed driver is
+        discarded and the page is retried once on a fresh one.
+        """
+        with self._slots:
+            for attempt in range(2):
+                driver, pages = self._checkout()
+                try:
+                    driver.get(url)
+                    try:
+                        WebDriverWait(driver, self.wait_timeout).until(
+                            EC.presence_of_element_located((By.CSS_SELECTOR, wait_selector))
+                        )
+                    except TimeoutException:
+                        pass
+                    source = driver.page_source
+                except WebDriverException:
+                    _quit(driver)
+                    if attempt:
+                        raise
+                    continue
+                self._checkin(driver, pages + 1)
+                return source
+
+    def close(self):
+        """Quits every idle driver; drivers still in use are quit when returned."""
+        self._closed = True
+        while True:
+            try:
+                driver, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            _quit(driver)
+
+
+def _quit(driver):
+    try:
+        driver.quit()
+    except WebDriverException:
+        pass
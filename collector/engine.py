@@ -0,0 +1,23 @@
+"""Bounded-concurrency fetch engine for query x platform batches."""
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CONCURRENCY = 8
+
+
+def fetch_matrix(queries, platforms, fetch, concurrency=DEFAULT_CONCURRENCY, initializer=None):
+    """
+    Runs ``fetch(query, platform)`` for every query/platform pair on a pool of at
+    most ``concurrency`` threads and yields ``(query, platform, result)`` tuples.
+
+    Results are yielded as soon as they finish, but never ahead of an earlier
+    pair, so the output order always matches the input order.
+    """
+    tasks = [(query, platform) for query in queries for platform in platforms]
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency), initializer=initializer)
+    try:
+        futures = [pool.submit(fetch, query, platform) for query, platform in tasks]
+        for (query, platform), future in zip(tasks, futures):
+            yield query, platform, future.result()
+    finally:
+        # If the caller stops early (e.g. a Streamlit rerun), drop queued work.
+        pool.shutdown(wait=False, cancel_futures=True)
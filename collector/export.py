@@ -0,0 +1,66 @@
+"""
+ZIP export of collected images, built once per distinct set of files.
+
+Streamlit reruns the whole script on every interaction, so building an archive
+there means re-reading and re-compressing every image each time. Here an
+archive is keyed by a hash of its files' paths, sizes and mtimes. It is only
+built the first time that exact set is requested, written straight to disk
+(never held in memory) and reused until the set changes. JPEG and PNG are
+already compressed, so entries are stored, not deflated.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from zipfile import ZIP_STORED, ZipFile
+
+from collector import CACHE_ROOT
+
+EXPORT_DIR = os.path.join(CACHE_ROOT, "exports")
+# Archives kept on disk; older ones are removed when a new one is built.
+MAX_EXPORTS = 16
+
+_lock = threading.Lock()
+
+
+def zip_images(filepaths, digest_for=None, export_dir=EXPORT_DIR):
+    """
+    Returns the path of a ZIP of ``filepaths``, reusing the existing archive when the
+    same files are exported again. With ``digest_for`` (e.g. ``ImageStore.digest_for``),
+    a file whose content is already in the archive under another name is skipped.
+    """
+    filepaths = sorted(set(filepaths))
+    fileset = hashlib.sha256()
+    for path in filepaths:
+        stat = os.stat(path)
+        fileset.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+    zip_path = os.path.join(export_dir, f"{fileset.hexdigest()}.zip")
+
+    with _lock:
+        if os.path.exists(zip_path):
+            os.utime(zip_path)
+            return zip_path
+        os.makedirs(export_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=export_dir, suffix=".part")
+        zipped_digests = set()
+        with os.fdopen(fd, "wb") as f, ZipFile(f, "w", compression=ZIP_STORED) as zip_file:
+            for path in filepaths:
+                if digest_for:
+                    digest = digest_for(path)
+                    if digest in zipped_digests:
+                        continue
+                    zipped_digests.add(digest)
+                zip_file.write(path, arcname=os.path.basename(path))
+        os.replace(tmp_path, zip_path)
+        _prune(export_dir)
+    return zip_path
+
+
+def _prune(export_dir):
+    archives = [entry for entry in os.scandir(export_dir) if entry.name.endswith(".zip")]
+    archives.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in archives[MAX_EXPORTS:]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,355 @@
+"""
+Pluggable HTML extraction backends behind one single-pass rule engine.
+
+A fetcher describes where a page keeps what it wants as a list of rules, each
+a ``(kind, arg)`` tuple:
+
+* ``("meta", prop)``         - ``content`` of the first ``<meta property=prop>``
+* ``("img_class", frags)``   - ``src`` of the first ``<img>`` whose class contains any of ``frags``
+* ``("img_src", frags)``     - ``src`` of the first ``<img>`` whose ``src`` contains any of ``frags``
+* ``("img_alt", template)``  - ``src`` of the first ``<img>`` whose ``alt`` contains
+                               ``template.format(**context)``, ignoring case
+* ``("icon", None)``         - ``href`` of the first ``<link rel="icon">``
+* ``("json_ld", None)``      - text of the first ``application/ld+json`` script
+* ``("json_ld_image", None)`` - the ``image`` (or author/main entity image) in that script
+* ``("h1", None)``, ``("title", None)`` - the element's ``.string``, as BeautifulSoup defines it
+
+``Document.collect(rules)`` walks the document once and returns the first value
+for every rule; ``rank(found, rules)`` then picks the best one by rule order.
+Each backend only supplies that walk:
+
+* ``lxml``  - lxml's C parser; the default when lxml is installed.
+* ``regex`` - a targeted tag scanner that never builds a tree.
+* ``soup``  - BeautifulSoup with ``html.parser``; the original path and the fallback.
+
+``HeadDocument`` sees only the ``<head>``, but can be fed a page chunk by chunk
+while it downloads (see ``http_client.get_head``).
+
+``benchmarks/bench_extract.py`` times them against each other and checks that
+they agree on every fixture.
+"""
+import html as html_lib
+import json
+import re
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:  # lxml is optional; BeautifulSoup covers everything it does
+    lxml = None
+
+DEFAULT_BACKEND = "lxml" if lxml else "soup"
+# The only elements any rule looks at.
+RULE_TAGS = ("meta", "link", "img", "script", "h1", "title")
+JSON_LD_TYPE = "application/ld+json"
+
+
+def parse_html(text, backend=None):
+    """Parses ``text`` with ``backend`` (default ``DEFAULT_BACKEND``), falling back to BeautifulSoup."""
+    backend = backend or DEFAULT_BACKEND
+    if backend == "lxml" and lxml:
+        try:
+            return LxmlDocument(text)
+        except (ValueError, etree.ParserError):
+            pass
+    elif backend == "regex":
+        return RegexDocument(text)
+    return SoupDocument(text)
+
+
+def _class_matches(value, class_keys):
+    value = " ".join((value or "").split())
+    return bool(value) and any(key in value for key in class_keys)
+
+
+def _match(rule, name, attrs, text, context):
+    """The value ``rule`` takes from one element, or None if the element does not match it."""
+    kind, arg = rule
+    if name == "img":
+        if kind == "img_class":
+            matched = _class_matches(attrs.get("class"), arg)
+        elif kind == "img_src":
+            matched = any(fragment in (attrs.get("src") or "") for fragment in arg)
+        elif kind == "img_alt":
+            alt = (attrs.get("alt") or "").lower()
+            matched = bool(alt) and arg.format(**context).lower() in alt
+        else:
+            return None
+        return (attrs.get("src") or None) if matched else None
+    if name == "meta":
+        return (attrs.get("content") or None) if kind == "meta" and attrs.get("property") == arg else None
+    if name == "link":
+        return (attrs.get("href") or None) if kind == "icon" and "icon" in (attrs.get("rel") or "").split() else None
+    if name == "script":
+        if kind in ("json_ld", "json_ld_image") and attrs.get("type") == JSON_LD_TYPE:
+            value = text()
+            return _json_ld_image(value) if kind == "json_ld_image" else value or None
+        return None
+    if kind == name:  # h1, title
+        return text()
+    return None
+
+
+def _json_ld_image(text):
+    """The image URL a JSON-LD block gives for the page's person or author, or None."""
+    try:
+        data = json.loads(text or "")
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    for entity in (data.get("mainEntity"), data.get("author"), data):
+        image = entity.get("image") if isinstance(entity, dict) else None
+        if isinstance(image, list):
+            image = image[0] if image else None
+        if isinstance(image, dict):
+            image = image.get("url") or image.get("contentUrl")
+        if isinstance(image, str) and image:
+            return image
+    return None
+
+
+def rank(found, rules):
+    """The value of the first rule in ``rules`` that ``found`` (from ``collect``) has a value for."""
+    return next((found[rule] for rule in rules if found.get(rule)), None)
+
+
+class Document:
+    """
+    The lookups every backend shares, all built on ``collect``. Subclasses provide
+    ``_elements()``: ``(name, attrs, text)`` for each ``RULE_TAGS`` element in document
+    order, with class/rel as space-separated strings and ``text()`` returning the
+    element's ``.string`` (the raw text for scripts).
+    """
+
+    def collect(self, rules, **context):
+        """
+        Walks the document once and returns ``{rule: value}`` holding the first match
+        of each rule. ``context`` fills the templates of ``img_alt`` rules.
+        """
+        pending = list(dict.fromkeys(rules))
+        found = {}
+        for name, attrs, text in self._elements():
+            matched = False
+            for rule in pending:
+                value = _match(rule, name, attrs, text, context)
+                if value is not None:
+                    found[rule] = value
+                    matched = True
+            if matched:
+                pending = [rule for rule in pending if rule not in found]
+                if not pending:
+                    break
+        return found
+
+    def _first(self, rule):
+        return self.collect([rule]).get(rule)
+
+    def meta_content(self, prop):
+        return self._first(("meta", prop))
+
+    def img_src(self, class_keys):
+        return self._first(("img_class", tuple(class_keys)))
+
+    def icon_href(self):
+        return self._first(("icon", None))
+
+    def json_ld(self):
+        return self._first(("json_ld", None))
+
+    def h1_string(self):
+        return self._first(("h1", None))
+
+    def title_string(self):
+        return self._first(("title", None))
+
+
+class SoupDocument(Document):
+    """BeautifulSoup/html.parser; the original backend."""
+
+    backend = "soup"
+
+    def __init__(self, text):
+        self.soup = BeautifulSoup(text, "html.parser")
+
+    def _elements(self):
+        for tag in self.soup.find_all(RULE_TAGS):
+            attrs = {key: " ".join(value) if isinstance(value, list) else value for key, value in tag.attrs.items()}
+            yield tag.name, attrs, lambda tag=tag: str(tag.string) if tag.string is not None else None
+
+
+class LxmlDocument(Document):
+    """lxml's C parser."""
+
+    backend = "lxml"
+
+    def __init__(self, text):
+        self.root = lxml.html.document_fromstring(text)
+
+    def _elements(self):
+        for tag in self.root.iter(*RULE_TAGS):
+            if tag.tag == "script":
+                yield tag.tag, tag.attrib, lambda tag=tag: tag.text
+            else:
+                yield tag.tag, tag.attrib, lambda tag=tag: _lxml_string(tag)
+
+
+def _lxml_string(tag):
+    """BeautifulSoup's ``.string``: the text of a tag whose only child is a single string or tag."""
+    while tag is not None:
+        children = list(tag)
+        if not children:
+            return tag.text or None
+        if len(children) > 1 or (tag.text or "") or (children[0].tail or ""):
+            return None
+        tag = children[0]
+    return None
+
+
+_TOKEN_RE = re.compile(
+    r"<!--.*?-->|<(meta|link|img|script|style|h1|title)\b((?:[^>\"']|\"[^\"]*\"|'[^']*')*)>",
+    re.IGNORECASE | re.DOTALL,
+)
+_ATTR_RE = re.compile(r"""([^\s=/>"']+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>"']+)))?""")
+_SINGLE_CHILD_RE = re.compile(r"<(\w+)\b[^>]*>(.*)</\1\s*>", re.DOTALL)
+# Elements whose content is raw text (and may itself contain "<img ..." strings) or inner text we need.
+_CONTENT_TAGS = {"script", "style", "h1", "title"}
+
+
+class RegexDocument(Document):
+    """
+    A single pass over the tags the lookups care about, without building a tree.
+    Comments are skipped, and script/style bodies are jumped over so markup
+    inside JavaScript strings is never mistaken for real tags.
+    """
+
+    backend = "regex"
+
+    def __init__(self, text):
+        self.tags = []
+        pos = 0
+        while True:
+            match = _TOKEN_RE.search(text, pos)
+            if not match:
+                break
+            pos = match.end()
+            name = match.group(1)
+            if not name:
+                continue
+            name = name.lower()
+            attrs = {}
+            for attr in _ATTR_RE.finditer(match.group(2)):
+                key = attr.group(1).lower()
+                if key not in attrs:
+                    value = next((v for v in attr.group(2, 3, 4) if v is not None), "")
+                    attrs[key] = html_lib.unescape(value)
+            inner = None
+            if name in _CONTENT_TAGS:
+                close = re.compile(rf"</{name}\s*>", re.IGNORECASE).search(text, pos)
+                end = close.start() if close else len(text)
+                inner = text[pos:end]
+                pos = close.end() if close else end
+            self.tags.append((name, attrs, inner))
+
+    def _elements(self):
+        for name, attrs, inner in self.tags:
+            if name == "script":
+                yield name, attrs, lambda inner=inner: inner or None
+            elif name != "style":
+                yield name, attrs, lambda inner=inner: _regex_string(inner)
+
+
+def _regex_string(inner):
+    while inner:
+        if "<" not in inner:
+            return html_lib.unescape(inner)
+        match = _SINGLE_CHILD_RE.fullmatch(inner)
+        if not match:
+            return None
+        inner = match.group(2)
+    return None
+
+
+# Tags that may appear in <head>; any other start tag means the body has begun.
+_HEAD_TAGS = {"html", "head", "meta", "link", "script", "style", "title", "base", "noscript", "template"}
+
+
+class HeadDocument(Document, HTMLParser):
+    """
+    An incremental parser for a page's ``<head>``. ``feed`` returns True once the head
+    has ended, or once everything in ``required`` has been found (meta properties, plus
+    ``"icon"``, ``"json_ld"`` or ``"title"``). After that the rest of the page is not
+    needed. Rules on body elements (``<img>``, ``<h1>``) never match.
+    """
+
+    backend = "head"
+
+    def __init__(self, required=()):
+        super().__init__()
+        self.required = set(required)
+        self.found = {}
+        self.elements = []
+        self.done = False
+        # Bytes of the page read so far; filled in by whoever streams it in.
+        self.bytes_read = 0
+        self._capture = None
+        self._text = []
+        self._nested = False
+
+    def feed(self, data):
+        if not self.done:
+            super().feed(data)
+        return self.done
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if self._capture:
+            self._nested = True
+        if tag not in _HEAD_TAGS:
+            self.done = True
+            return
+        attrs = dict(attrs)
+        if tag in ("meta", "link"):
+            self.elements.append((tag, attrs, None))
+        if tag == "meta" and attrs.get("property"):
+            self._found(attrs["property"], attrs.get("content"))
+        elif tag == "link" and "icon" in (attrs.get("rel") or "").split():
+            self._found("icon", attrs.get("href"))
+        elif tag == "script" and attrs.get("type") == JSON_LD_TYPE and "json_ld" not in self.found:
+            self._start_capture("json_ld", attrs)
+        elif tag == "title" and "title" not in self.found:
+            self._start_capture("title", attrs)
+
+    def handle_data(self, data):
+        if self._capture:
+            self._text.append(data)
+
+    def handle_endtag(self, tag):
+        if self.done:
+            return
+        if self._capture and tag == ("script" if self._capture == "json_ld" else "title"):
+            text = None if self._nested else "".join(self._text) or None
+            self._capture = None
+            self.elements.append((tag, self._capture_attrs, text))
+            self._found("json_ld" if tag == "script" else "title", text)
+        elif tag == "head":
+            self.done = True
+
+    def _start_capture(self, key, attrs):
+        self._capture = key
+        self._capture_attrs = attrs
+        self._text = []
+        self._nested = False
+
+    def _found(self, key, value):
+        self.found.setdefault(key, value)
+        if self.required and self.required.issubset(self.found):
+            self.done = True
+
+    def _elements(self):
+        for name, attrs, text in self.elements:
+            yield name, attrs, lambda text=text: text
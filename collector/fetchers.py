@@ -0,0 +1,77 @@
+"""
+Single-platform Substack and Medium fetchers used by the LinkedIn app.
+
+These predate ``collector.profiles`` and keep their own lookup flow: a fixed
+address per username, no web search, and results returned as
+``(filename, filepath)``. The image is found with the platform's
+``image_rules``, the same as ``collector.profiles``. They live here rather
+than in the app so the benchmarks can drive them without Streamlit.
+"""
+from collector import http_client
+from collector.extract import parse_html
+from collector.image_store import get_store
+from collector.profiles import PLATFORMS, collect_profile, extract_image_url
+
+SAVE_FOLDER = "images"
+
+
+def _find_image_url(profile_url, platform, **kwargs):
+    """The profile image URL on ``profile_url`` by ``platform``'s rules, or None."""
+    response = http_client.get(profile_url, **kwargs)
+    if response.status_code != 200:
+        return None
+    image_rules = PLATFORMS[platform]["image_rules"]
+    found = collect_profile(parse_html(response.text), response.url, image_rules)
+    return extract_image_url(found, response.url, image_rules)
+
+
+def fetch_substack_profile_image(profile_url, save_folder=SAVE_FOLDER):
+    """
+    Fetches the profile image from a Substack profile URL or username.
+    Returns (filename, filepath) or (None, None) on failure.
+    """
+    try:
+        # Normalize input: allow username or full URL
+        if not profile_url.startswith("http"):
+            profile_url = f"https://{profile_url}.substack.com/"
+        if not profile_url.endswith("/"):
+            profile_url += "/"
+        img_url = _find_image_url(profile_url, "substack")
+        if not img_url:
+            return None, None
+
+        # Download image
+        store = get_store(save_folder)
+        download = http_client.download(img_url, store.incoming_dir)
+        username = profile_url.split("//")[-1].split(".")[0]
+        filename = f"substack_{username}.jpg"
+        filepath = store.save_file(download["path"], filename, digest=download["digest"])
+        return filename, filepath
+    except Exception as e:
+        return None, None
+
+
+def fetch_medium_profile_image(profile_url, save_folder=SAVE_FOLDER):
+    """
+    Fetches the profile image from a Medium profile URL or username.
+    Returns (filename, filepath) or (None, None) on failure.
+    """
+    try:
+        # Normalize URL
+        if not profile_url.startswith("http"):
+            profile_url = f"https://medium.com/@{profile_url.strip('@')}"
+        if not profile_url.endswith("/"):
+            profile_url += "/"
+        img_url = _find_image_url(profile_url, "medium", allow_redirects=True)
+        if not img_url:
+            return None, None
+
+        # Download image
+        store = get_store(save_folder)
+        download = http_client.download(img_url, store.incoming_dir)
+        username = profile_url.strip('/').split('/')[-1].strip('@')
+        filename = f"medium_{username}.jpg"
+        filepath = store.save_file(download["path"], filename, digest=download["digest"])
+        return filename, filepath
+    except Exception as e:
+        return None, None
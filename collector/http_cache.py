@@ -0,0 +1,179 @@
+"""
+Persistent on-disk HTTP response cache with conditional revalidation.
+
+Bodies live in ``CACHE_DIR/bodies`` and are indexed in a small SQLite table
+keyed by the requested URL, together with their ETag/Last-Modified validators.
+Entries younger than ``ttl`` are served straight from disk. Older ones are
+revalidated with If-None-Match/If-Modified-Since, so an unchanged page costs a
+304 instead of a full download. Once the bodies exceed ``max_bytes``, the least
+recently used entries are evicted.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from collector import CACHE_ROOT, metrics
+
+CACHE_DIR = os.path.join(CACHE_ROOT, "http")
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Only these response headers are kept; they are all the fetchers look at.
+KEPT_HEADERS = ["Content-Type", "ETag", "Last-Modified"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    url TEXT PRIMARY KEY,
+    final_url TEXT NOT NULL,
+    headers TEXT NOT NULL,
+    body TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+
+class HttpCache:
+    """A size-bounded LRU cache of successful GET responses, keyed by URL."""
+
+    def __init__(self, directory=CACHE_DIR, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(directory, "bodies"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite"), timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(_SCHEMA)
+
+    def get(self, fetch, url, **kwargs):
+        """
+        Returns a response for ``url``: a fresh cached copy, a cached copy the server
+        confirmed with a 304, or whatever ``fetch(url, **kwargs)`` returned (cached if it
+        was a 200). ``fetch`` is ``requests.get`` or anything with its signature.
+        """
+        entry = self.lookup(url)
+        if entry and self.is_fresh(entry):
+            self.touch(entry)
+            return self.response(entry)
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if entry:
+            headers.update(self.conditional_headers(entry))
+        response = fetch(url, headers=headers, **kwargs)
+        if response.status_code == 304 and entry:
+            self.touch(entry, revalidated=True)
+            return self.response(entry)
+        if response.status_code == 200:
+            self.store(url, response)
+        return response
+
+    def lookup(self, url):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM entries WHERE url = ?", (url,)).fetchone()
+        if row and not os.path.exists(self._body_path(row["body"])):
+            self._delete([row])
+            return None
+        return row
+
+    def is_fresh(self, entry):
+        return time.time() - entry["stored_at"] < self.ttl
+
+    def conditional_headers(self, entry):
+        """The If-None-Match / If-Modified-Since headers that revalidate ``entry``."""
+        stored = json.loads(entry["headers"])
+        headers = {}
+        if stored.get("ETag"):
+            headers["If-None-Match"] = stored["ETag"]
+        if stored.get("Last-Modified"):
+            headers["If-Modified-Since"] = stored["Last-Modified"]
+        return headers
+
+    def store(self, url, response, body_file=None, content=None):
+        """
+        Writes a 200 response body to disk and indexes it under ``url``. For streamed
+        responses, pass the file the body was already saved to as ``body_file``, or the
+        bytes read as ``content``.
+        """
+        body = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        path = self._body_path(body)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            if body_file:
+                with open(body_file, "rb") as source:
+                    shutil.copyfileobj(source, f)
+            else:
+                f.write(response.content if content is None else content)
+        os.replace(tmp_path, path)
+
+        headers = {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers}
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, response.url, json.dumps(headers), body, os.path.getsize(path), now, now),
+            )
+        self._evict()
+
+    def touch(self, entry, revalidated=False):
+        """Marks ``entry`` as just used (i.e. a cache hit); a revalidated entry also restarts its TTL."""
+        metrics.count("cache_hits_total", cache="http_revalidated" if revalidated else "http")
+        now = time.time()
+        with self._lock, self._db:
+            if revalidated:
+                self._db.execute("UPDATE entries SET stored_at = ?, last_used = ? WHERE url = ?", (now, now, entry["url"]))
+            else:
+                self._db.execute("UPDATE entries SET last_used = ? WHERE url = ?", (now, entry["url"]))
+
+    def body_path(self, entry):
+        return self._body_path(entry["body"])
+
+    def response(self, entry):
+        """A requests.Response rebuilt from the cached entry, with ``from_cache = True``."""
+        with open(self._body_path(entry["body"]), "rb") as f:
+            content = f.read()
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = entry["final_url"]
+        response.headers = CaseInsensitiveDict(json.loads(entry["headers"]))
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response._content = content
+        response.from_cache = True
+        return response
+
+    def _evict(self):
+        with self._lock:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            victims = []
+            for row in self._db.execute("SELECT url, body, size FROM entries ORDER BY last_used"):
+                if total <= self.max_bytes:
+                    break
+                victims.append(row)
+                total -= row["size"]
+        self._delete(victims)
+
+    def _delete(self, rows):
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM entries WHERE url = ?", [(row["url"],) for row in rows])
+        for row in rows:
+            try:
+                os.remove(self._body_path(row["body"]))
+            except FileNotFoundError:
+                pass
+
+    def _body_path(self, body):
+        return os.path.join(self.directory, "bodies", body[:2], body)
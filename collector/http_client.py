@@ -0,0 +1,268 @@
+"""
+Shared HTTP client with per-host keep-alive connection pools.
+
+Every fetcher goes through the one session here so repeated requests to
+medium.com, *.substack.com and their CDNs reuse open TCP/TLS connections
+instead of paying for a new handshake each time. Every request also passes
+through the per-host limiter in ``collector.ratelimit``, which paces it and
+retries throttled or transient failures.
+"""
+import codecs
+import hashlib
+import os
+import tempfile
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from collector import ratelimit
+from collector.extract import HeadDocument
+from collector.http_cache import HttpCache
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+DEFAULT_TIMEOUT = 10
+# How many distinct hosts keep a pool, and how many idle connections each pool keeps.
+POOL_CONNECTIONS = 32
+POOL_MAXSIZE = 16
+# Downloads larger than this are aborted; a bad og:image can point at a huge banner.
+MAX_DOWNLOAD_BYTES = 10 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# CDNs sometimes label images as generic binary; anything else (e.g. text/html) is refused.
+DOWNLOAD_CONTENT_TYPES = ["image/", "application/octet-stream", "binary/octet-stream"]
+# Head-only fetches read this much at a time, and give up on finding </head> after MAX_HEAD_BYTES.
+HEAD_CHUNK_SIZE = 16 * 1024
+MAX_HEAD_BYTES = 1024 * 1024
+
+_lock = threading.Lock()
+_session = None
+_adapter = None
+_cache = None
+
+
+class DownloadError(requests.RequestException):
+    """Raised when a download is refused for its type or size."""
+
+
+class _CountingAdapter(HTTPAdapter):
+    """An HTTPAdapter that remembers the counters of host pools it has evicted."""
+
+    def __init__(self, *args, **kwargs):
+        self.retired = {}
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        pools = self.poolmanager.pools
+        dispose = pools.dispose_func
+
+        def retire(pool):
+            _add_counts(self.retired, pool)
+            if dispose:
+                dispose(pool)
+
+        pools.dispose_func = retire
+
+    def live_pools(self):
+        pools = self.poolmanager.pools
+        return [pool for pool in (pools.get(key) for key in pools.keys()) if pool is not None]
+
+
+def _add_counts(totals, pool):
+    host = f"{pool.scheme}://{pool.host}"
+    entry = totals.setdefault(host, {"requests": 0, "connections": 0})
+    entry["requests"] += pool.num_requests
+    entry["connections"] += pool.num_connections
+
+
+def configure(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE):
+    """(Re)builds the shared session with the given pool sizes."""
+    global _session, _adapter
+    with _lock:
+        if _session is not None:
+            _session.close()
+        adapter = _CountingAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        session = requests.Session()
+        session.headers.update(HEADERS)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _session, _adapter = session, adapter
+    return session
+
+
+def get_session():
+    """Returns the process-wide pooled session, creating it on first use."""
+    if _session is None:
+        configure()
+    return _session
+
+
+def get_cache():
+    """Returns the process-wide on-disk HTTP cache, creating it on first use."""
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = HttpCache()
+    return _cache
+
+
+def _send(url, **kwargs):
+    """A pooled GET, paced and retried by the host's rate limiter."""
+    return ratelimit.send(url, lambda: get_session().get(url, **kwargs))
+
+
+def get(url, cache=False, **kwargs):
+    """
+    Like ``requests.get``, but pooled and rate limited, with ``HEADERS`` and a default
+    timeout applied. With ``cache=True`` the on-disk HTTP cache answers or revalidates
+    the request first.
+    """
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    if cache:
+        return get_cache().get(_send, url, **kwargs)
+    return _send(url, **kwargs)
+
+
+def get_head(url, required=(), cache=False, max_bytes=MAX_HEAD_BYTES, **kwargs):
+    """
+    Streams ``url`` into a ``HeadDocument`` and stops reading once ``</head>`` is seen or
+    every field in ``required`` has been found, so the page body is never downloaded.
+    Returns ``(response, doc)``. The response body is left unread; ``doc.bytes_read`` is
+    how much was actually transferred.
+
+    With ``cache=True``, a fresh or revalidated (304) cached page is parsed from disk
+    instead. A page read in full is cached as usual; a partly read one is cached under
+    ``head_cache_key(url)``, so ``get(url, cache=True)`` never mistakes it for the whole
+    page, and its connection is closed rather than returned to the pool.
+    """
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    doc = HeadDocument(required)
+    http_cache = get_cache() if cache else None
+    entry = (http_cache.lookup(url) or http_cache.lookup(head_cache_key(url))) if http_cache else None
+    if entry and http_cache.is_fresh(entry):
+        http_cache.touch(entry)
+        response = http_cache.response(entry)
+        doc.feed(response.text)
+        return response, doc
+
+    headers = dict(kwargs.pop("headers", None) or {})
+    if entry:
+        headers.update(http_cache.conditional_headers(entry))
+    with _send(url, headers=headers, stream=True, **kwargs) as response:
+        if response.status_code == 304 and entry:
+            http_cache.touch(entry, revalidated=True)
+            response = http_cache.response(entry)
+            doc.feed(response.text)
+            return response, doc
+        if response.status_code == 200:
+            decoder = _incremental_decoder(response.encoding)
+            chunks = []
+            complete = True
+            for chunk in response.iter_content(HEAD_CHUNK_SIZE):
+                chunks.append(chunk)
+                doc.bytes_read += len(chunk)
+                if doc.feed(decoder.decode(chunk)) or doc.bytes_read >= max_bytes:
+                    complete = False
+                    break
+            if http_cache:
+                http_cache.store(url if complete else head_cache_key(url), response, content=b"".join(chunks))
+    return response, doc
+
+
+def head_cache_key(url):
+    """The HTTP cache key of the partly read page at ``url`` (a fragment is never sent, so no request has it)."""
+    return f"{url}#head"
+
+
+def _incremental_decoder(encoding):
+    try:
+        return codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+def download(url, dest_dir, max_bytes=MAX_DOWNLOAD_BYTES, cache=False, **kwargs):
+    """
+    Streams ``url`` in chunks into a new temp file in ``dest_dir``. Peak memory stays
+    one chunk, however large the body is. Content-Type and Content-Length are checked
+    before anything is read, and the transfer is aborted once it passes ``max_bytes``.
+
+    Returns ``{"path", "digest", "size", "url"}``. The caller owns the temp file and
+    normally renames it into place (see ``ImageStore.save_file``).
+    """
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    http_cache = get_cache() if cache else None
+    entry = http_cache.lookup(url) if http_cache else None
+    if entry and http_cache.is_fresh(entry):
+        http_cache.touch(entry)
+        return _copy_to_temp(http_cache.body_path(entry), dest_dir, entry["final_url"])
+
+    headers = dict(kwargs.pop("headers", None) or {})
+    if entry:
+        headers.update(http_cache.conditional_headers(entry))
+    with _send(url, headers=headers, stream=True, **kwargs) as response:
+        if response.status_code == 304 and entry:
+            http_cache.touch(entry, revalidated=True)
+            return _copy_to_temp(http_cache.body_path(entry), dest_dir, entry["final_url"])
+        response.raise_for_status()
+        _check_download_headers(response, max_bytes)
+
+        sha = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=dest_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise DownloadError(f"{url} is larger than {max_bytes} bytes", response=response)
+                    sha.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    if http_cache:
+        http_cache.store(url, response, body_file=tmp_path)
+    return {"path": tmp_path, "digest": sha.hexdigest(), "size": size, "url": response.url}
+
+
+def _check_download_headers(response, max_bytes):
+    content_type = response.headers.get("Content-Type", "").lower()
+    if content_type and not any(content_type.startswith(allowed) for allowed in DOWNLOAD_CONTENT_TYPES):
+        raise DownloadError(f"{response.url} is {content_type}, not an image", response=response)
+    content_length = response.headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise DownloadError(f"{response.url} is {content_length} bytes, over the {max_bytes} byte cap", response=response)
+
+
+def _copy_to_temp(source, dest_dir, url):
+    sha = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=dest_dir, suffix=".part")
+    with os.fdopen(fd, "wb") as f, open(source, "rb") as src:
+        for chunk in iter(lambda: src.read(DOWNLOAD_CHUNK_SIZE), b""):
+            sha.update(chunk)
+            f.write(chunk)
+    return {"path": tmp_path, "digest": sha.hexdigest(), "size": os.path.getsize(tmp_path), "url": url}
+
+
+def connection_stats():
+    """
+    Reports requests vs. new connections per host. ``reused`` is the number of
+    requests that rode on an existing keep-alive connection, i.e. handshakes saved.
+    """
+    if _adapter is None:
+        return {"hosts": {}, "requests": 0, "connections": 0, "reused": 0}
+    hosts = {host: dict(counts) for host, counts in _adapter.retired.items()}
+    for pool in _adapter.live_pools():
+        _add_counts(hosts, pool)
+    for counts in hosts.values():
+        counts["reused"] = max(0, counts["requests"] - counts["connections"])
+    return {
+        "hosts": hosts,
+        "requests": sum(c["requests"] for c in hosts.values()),
+        "connections": sum(c["connections"] for c in hosts.values()),
+        "reused": sum(c["reused"] for c in hosts.values()),
+    }
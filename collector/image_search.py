@@ -0,0 +1,148 @@
+"""
+Bulk DuckDuckGo image search with parallel downloads.
+
+One producer thread runs the searches, paced by the DuckDuckGo rate limiter,
+and puts every result on a bounded queue. A pool of downloader threads takes
+them off, downloads each image and saves it under a name made from its
+content hash (``ddg_<sha256 prefix>.jpg``). Two results therefore never
+overwrite each other, and the same picture found twice is saved once. The
+bounded queue keeps the searches from running far ahead of the downloads.
+"""
+import os
+import queue
+import threading
+
+from duckduckgo_search import DDGS
+
+from collector import http_client, metrics, ratelimit
+from collector.engine import DEFAULT_CONCURRENCY
+from collector.image_store import get_store
+
+SAVE_FOLDER = "images"
+MAX_RESULTS = 10
+# Search results waiting for a downloader; the producer blocks once this many are queued.
+QUEUE_SIZE = 32
+# Hex digits of the SHA-256 used in file names.
+NAME_DIGEST_LENGTH = 16
+# Image hosts often refuse the default client; a desktop browser's agent gets through.
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.6367.207 Brave/124.0.6367.207 Safari/537.36"
+
+_DONE = object()
+
+
+def image_filename(digest):
+    return f"ddg_{digest[:NAME_DIGEST_LENGTH]}.jpg"
+
+
+def fetch_images(queries, max_results=MAX_RESULTS, save_folder=SAVE_FOLDER, workers=DEFAULT_CONCURRENCY):
+    """
+    Searches DuckDuckGo Images for every query and downloads up to ``max_results``
+    images per query on ``workers`` threads. Yields a dict per finished download with
+    ``query``, ``image_url``, ``filepath`` and ``filename`` (None on failure), ``error``,
+    and that query's progress so far: ``total`` results found, ``done`` finished and
+    ``saved``. Each search also yields one event with no ``image_url``, once its
+    results are known or, with ``error`` set, when it fails.
+
+    Closing the generator (e.g. on a Streamlit rerun) stops the search and the
+    downloads queued behind it.
+    """
+    queries = list(dict.fromkeys(queries))
+    workers = max(1, workers)
+    store = get_store(save_folder)
+    results = queue.Queue(maxsize=QUEUE_SIZE)
+    finished = queue.Queue()
+    stop = threading.Event()
+    progress = {query: {"total": 0, "done": 0, "saved": 0} for query in queries}
+    progress_lock = threading.Lock()
+
+    def report(query, image_url=None, filepath=None, error=None):
+        with progress_lock:
+            counts = progress[query]
+            if image_url:
+                counts["done"] += 1
+                counts["saved"] += filepath is not None
+            event = dict(counts)
+        event.update(
+            query=query,
+            image_url=image_url,
+            filepath=filepath,
+            filename=os.path.basename(filepath) if filepath else None,
+            error=error,
+        )
+        finished.put(event)
+
+    def offer(item):
+        """Queues ``item``, waiting for room unless the run is stopped; False if it was."""
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        searched = set()
+        try:
+            with DDGS() as ddgs:
+                for query in queries:
+                    if stop.is_set():
+                        return
+                    searched.add(query)
+                    try:
+                        with metrics.timed("image_search", platform="duckduckgo"):
+                            found = ratelimit.ddgs_call(lambda: ddgs.images(query, max_results=max_results))
+                    except Exception as e:
+                        metrics.count("search_errors_total")
+                        report(query, error=f"Image search failed: {e}")
+                        continue
+                    image_urls = [result["image"] for result in found if result.get("image")]
+                    with progress_lock:
+                        progress[query]["total"] = len(image_urls)
+                    report(query)
+                    for image_url in image_urls:
+                        if not offer((query, image_url)):
+                            return
+        except Exception as e:
+            # The client itself failed (e.g. DDGS() could not be set up): close out every query not yet searched.
+            for query in queries:
+                if query not in searched:
+                    metrics.count("search_errors_total")
+                    report(query, error=f"Image search failed: {e}")
+        finally:
+            for _ in range(workers):
+                offer(_DONE)
+
+    def download():
+        while not stop.is_set():
+            try:
+                item = results.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            query, image_url = item
+            try:
+                with metrics.timed("download", platform="duckduckgo"):
+                    downloaded = http_client.download(image_url, store.incoming_dir, headers={"User-Agent": USER_AGENT})
+                filepath = store.save_file(downloaded["path"], image_filename(downloaded["digest"]), digest=downloaded["digest"])
+            except Exception as e:
+                # Any error fails this one image; the worker moves on to the next.
+                metrics.count("failures_total", platform="duckduckgo", reason=type(e).__name__)
+                report(query, image_url, error=str(e))
+            else:
+                report(query, image_url, filepath)
+
+    threads = [threading.Thread(target=produce, name="image-search", daemon=True)]
+    threads += [threading.Thread(target=download, name=f"image-download-{i}", daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads) or not finished.empty():
+            try:
+                yield finished.get(timeout=0.1)
+            except queue.Empty:
+                pass
+    finally:
+        stop.set()
+
@@ -0,0 +1,260 @@
+"""
+Content-addressed image store.
+
+Image bytes are stored once under ``<folder>/.store/blobs``, keyed by their
+SHA-256. The human-readable ``<platform>_<user>.jpg`` names the apps show are
+hard links to those blobs (or copies where links are unsupported). A SQLite
+manifest maps every name to its digest, so identical avatars saved under
+different names take the space of one, and re-saving an image we already
+hold skips the write.
+
+Every blob also gets a perceptual hash. When a new image is within
+``near_duplicate_radius`` of one already stored (the same avatar at another
+CDN size or compression), the manifest flags it and records which image it
+resembles. It keeps its own bytes unless the caller asks for it to be linked
+to the existing blob instead: two different people can have similar photos.
+"""
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from collector import thumbnails
+from collector.phash import DEFAULT_RADIUS, BKTree, dhash_file
+
+STORE_DIR = ".store"
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS names (
+        name TEXT PRIMARY KEY,
+        digest TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        updated_at REAL NOT NULL,
+        near_duplicate INTEGER NOT NULL DEFAULT 0,
+        duplicate_of TEXT
+    )
+    """,
+    # Hashes are stored as hex: SQLite integers are signed and a dHash uses all 64 bits.
+    "CREATE TABLE IF NOT EXISTS phashes (digest TEXT PRIMARY KEY, phash TEXT NOT NULL)",
+]
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(folder):
+    """Returns the shared store for ``folder``, opening it on first use."""
+    key = os.path.abspath(folder)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ImageStore(folder)
+        return _stores[key]
+
+
+class ImageStore:
+    """Stores image bytes by SHA-256 and exposes them under readable file names."""
+
+    def __init__(self, folder, near_duplicate_radius=DEFAULT_RADIUS):
+        self.folder = folder
+        self.near_duplicate_radius = near_duplicate_radius
+        self.blob_dir = os.path.join(folder, STORE_DIR, "blobs")
+        # Downloads land here first, on the same filesystem, so moving them into place is atomic.
+        self.incoming_dir = os.path.join(folder, STORE_DIR, "incoming")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.incoming_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(folder, STORE_DIR, "manifest.sqlite"), timeout=30, check_same_thread=False)
+        with self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                self._db.execute(statement)
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(names)")]
+            if "near_duplicate" not in columns:
+                self._db.execute("ALTER TABLE names ADD COLUMN near_duplicate INTEGER NOT NULL DEFAULT 0")
+            if "duplicate_of" not in columns:
+                self._db.execute("ALTER TABLE names ADD COLUMN duplicate_of TEXT")
+        self._phash_index = None
+
+    def save_bytes(self, content, filename):
+        """Stores ``content`` as ``filename``; see ``save_file``."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.incoming_dir, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        return self.save_file(tmp_path, filename, digest=hashlib.sha256(content).hexdigest())
+
+    def save_file(self, path, filename, digest=None, near_duplicates=True, substitute=False):
+        """
+        Moves the finished file at ``path`` (ideally in ``incoming_dir``) into the store
+        and links it as ``filename`` in the folder; returns that path. If the bytes are
+        already stored, the file is dropped and the existing blob is linked instead.
+        A near-duplicate of a stored image is flagged in the manifest (see
+        ``near_duplicate_of``); with ``substitute=True`` it is also dropped in favour of
+        the stored image. ``near_duplicates=False`` skips that check, for files meant
+        to replace the picture they resemble.
+        """
+        try:
+            digest = digest or _hash_file(path)
+            blob = self.blob_path(digest)
+            if os.path.exists(blob):
+                os.remove(path)
+                return self._link(blob, digest, os.path.getsize(blob), filename)
+
+            phash = dhash_file(path)
+            original = None
+            if phash is not None and near_duplicates and self.near_duplicate_radius is not None:
+                index = self._index()
+                with self._lock:
+                    matches = index.search(phash, self.near_duplicate_radius)
+                if matches:
+                    original = matches[0][1]
+                    if substitute:
+                        os.remove(path)
+                        original_blob = self.blob_path(original)
+                        return self._link(original_blob, original, os.path.getsize(original_blob), filename, duplicate_of=original)
+
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            shutil.move(path, blob)
+            if phash is not None:
+                self._add_phash(digest, phash)
+            thumbnails.schedule(blob, digest)
+            return self._link(blob, digest, os.path.getsize(blob), filename, duplicate_of=original)
+        except BaseException:
+            # Whatever went wrong, the file must not be left behind in incoming_dir.
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+
+    def rename(self, filepath, filename):
+        """Links the image at ``filepath`` under ``filename`` as well and returns the new path; see ``remove``."""
+        digest = self.digest_for(filepath)
+        blob = self.blob_path(digest)
+        return self._link(blob, digest, os.path.getsize(blob), filename)
+
+    def remove(self, filepath):
+        """Removes the name ``filepath``, and its blob once no other name links to it."""
+        digest = self.digest_for(filepath) if os.path.exists(filepath) else None
+        if digest:
+            os.remove(filepath)
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM names WHERE name = ?", (os.path.basename(filepath),))
+        if digest:
+            self.prune(digest)
+
+    def prune(self, digest):
+        """Deletes the blob ``digest`` if no name links to it any more."""
+        with self._lock, self._db:
+            if self._db.execute("SELECT 1 FROM names WHERE digest = ?", (digest,)).fetchone():
+                return
+            self._db.execute("DELETE FROM phashes WHERE digest = ?", (digest,))
+            # The BK-tree cannot drop entries; it is rebuilt from the manifest on next use.
+            self._phash_index = None
+        blob = self.blob_path(digest)
+        if os.path.exists(blob):
+            os.remove(blob)
+
+    def near_duplicate_of(self, filepath):
+        """
+        If ``filepath`` was saved as a near-duplicate, returns the name of the
+        image it was matched to (the first name stored for that blob).
+        """
+        with self._lock:
+            # Rows from before ``duplicate_of`` existed were always substituted.
+            row = self._db.execute(
+                """
+                SELECT original.name FROM names AS copy
+                JOIN names AS original
+                    ON original.digest = COALESCE(copy.duplicate_of, copy.digest) AND original.name != copy.name
+                WHERE copy.name = ? AND copy.near_duplicate = 1
+                ORDER BY original.updated_at LIMIT 1
+                """,
+                (os.path.basename(filepath),),
+            ).fetchone()
+        return row[0] if row else None
+
+    def digest_for(self, filepath):
+        """The SHA-256 of the image at ``filepath``, from the manifest when it is known."""
+        with self._lock:
+            row = self._db.execute("SELECT digest FROM names WHERE name = ?", (os.path.basename(filepath),)).fetchone()
+        if row:
+            return row[0]
+        return _hash_file(filepath)
+
+    def thumbnail(self, filepath):
+        """The gallery thumbnail for ``filepath``, made now if the worker pool has not got to it yet."""
+        return thumbnails.make_thumbnail(filepath, self.digest_for(filepath))
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def adopt_existing(self):
+        """Moves files already in the folder into the store so duplicates share one blob."""
+        adopted = 0
+        for entry in os.scandir(self.folder):
+            if not entry.is_file():
+                continue
+            with self._lock:
+                known = self._db.execute("SELECT 1 FROM names WHERE name = ?", (entry.name,)).fetchone()
+            if known:
+                continue
+            digest = _hash_file(entry.path)
+            blob = self.blob_path(digest)
+            if not os.path.exists(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                shutil.copyfile(entry.path, blob)
+                phash = dhash_file(blob)
+                if phash is not None:
+                    self._add_phash(digest, phash)
+            self._link(blob, digest, os.path.getsize(blob), entry.name)
+            adopted += 1
+        return adopted
+
+    def _index(self):
+        """The BK-tree over every stored perceptual hash, loaded from the manifest once."""
+        with self._lock:
+            if self._phash_index is None:
+                tree = BKTree()
+                for digest, phash in self._db.execute("SELECT digest, phash FROM phashes"):
+                    tree.add(int(phash, 16), digest)
+                self._phash_index = tree
+            return self._phash_index
+
+    def _add_phash(self, digest, phash):
+        index = self._index()
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO phashes VALUES (?, ?)", (digest, f"{phash:016x}"))
+            index.add(phash, digest)
+
+    def _link(self, blob, digest, size, filename, duplicate_of=None):
+        filepath = os.path.join(self.folder, filename)
+        if not (os.path.exists(filepath) and os.path.samefile(blob, filepath)):
+            tmp_path = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                os.link(blob, tmp_path)
+            except OSError:
+                shutil.copyfile(blob, tmp_path)
+            os.replace(tmp_path, filepath)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?, ?, ?)",
+                (filename, digest, size, time.time(), int(duplicate_of is not None), duplicate_of),
+            )
+        return filepath
+
+
+def _hash_file(filepath, chunk_size=64 * 1024):
+    sha = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+if __name__ == "__main__":
+    # python -m collector.image_store images
+    for folder in sys.argv[1:] or ["images"]:
+        print(f"{folder}: adopted {get_store(folder).adopt_existing()} file(s)")
@@ -0,0 +1,291 @@
+"""
+Resumable, lease-based SQLite job queue of (query, platform) lookups.
+
+A batch is a named list of queries crossed with platforms, and each pair is one
+task. A worker claims a task by taking a lease on it. The lease is a random
+token with a short expiry that ``work`` renews while the task runs, and only
+its holder may complete or fail the task. If a worker crashes, is killed or
+is abandoned (a closed Streamlit session), its lease runs out within
+``LEASE_SECONDS`` and any other worker takes the task over; leases held by
+dead processes on this machine are reclaimed sooner. Finished tasks are never run again, so a restarted
+batch resumes exactly where it stopped. The file is in WAL mode and claims are
+single atomic UPDATEs, so any number of threads and worker processes can work
+one batch. WAL needs a local disk, so workers must share a machine, not a
+network mount.
+"""
+import json
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from collector import CACHE_ROOT
+from collector.engine import DEFAULT_CONCURRENCY
+
+DB_PATH = os.path.join(CACHE_ROOT, "jobs.sqlite")
+# A task whose lease has not been renewed for this long is handed to another worker.
+LEASE_SECONDS = 60
+# How often ``work`` renews the leases of the tasks it is running.
+HEARTBEAT_SECONDS = LEASE_SECONDS / 4
+# How often ``claim`` looks for leases held by dead processes on this host.
+RECLAIM_SECONDS = 10
+# Tasks that raise are retried until they have been attempted this many times.
+MAX_ATTEMPTS = 3
+STATES = ["pending", "running", "done", "failed"]
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS batches (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        created_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY,
+        batch_id INTEGER NOT NULL REFERENCES batches (id),
+        query TEXT NOT NULL,
+        platform TEXT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        worker TEXT,
+        lease TEXT,
+        lease_expires REAL,
+        result TEXT,
+        error TEXT,
+        updated_at REAL NOT NULL,
+        UNIQUE (batch_id, query, platform)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (batch_id, state, id)",
+    # Claims across all batches, and the dead-worker scan.
+    "CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, id)",
+]
+
+
+def default_worker_id():
+    """``host:pid``, which lets a later run on the same host spot leases left by a dead process."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """The batches and tasks in one SQLite file."""
+
+    def __init__(self, path=DB_PATH, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._reclaimed_at = 0.0
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                self._db.execute(statement)
+
+    def add_batch(self, name, queries, platforms):
+        """
+        Creates batch ``name`` with a task per query and platform, or adds any new
+        pairs to the existing batch of that name. Returns the batch id.
+        """
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("INSERT OR IGNORE INTO batches (name, created_at) VALUES (?, ?)", (name, now))
+            batch_id = self._db.execute("SELECT id FROM batches WHERE name = ?", (name,)).fetchone()[0]
+            self._db.executemany(
+                "INSERT OR IGNORE INTO tasks (batch_id, query, platform, updated_at) VALUES (?, ?, ?, ?)",
+                [(batch_id, query, platform, now) for query in queries for platform in platforms],
+            )
+        return batch_id
+
+    def batch_id(self, name):
+        """The id of batch ``name``, or None if there is no such batch."""
+        with self._lock:
+            row = self._db.execute("SELECT id FROM batches WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def claim(self, worker, batch_id=None):
+        """
+        Leases the next runnable task (pending, or running with an expired lease) to
+        ``worker``. Returns the task as a dict, including its ``lease`` token, or None
+        if nothing is runnable right now.
+        """
+        now = time.time()
+        if now - self._reclaimed_at >= RECLAIM_SECONDS:
+            self._reclaimed_at = now
+            self._reclaim_dead_workers()
+        # Separate lookups for pending tasks and expired leases, each of which an index answers.
+        batch_filter, params = ("batch_id = ? AND ", [batch_id]) if batch_id is not None else ("", [])
+        with self._lock, self._db:
+            # One UPDATE picks and leases the task, so two workers can never claim the same one.
+            row = self._db.execute(
+                f"""
+                UPDATE tasks SET state = 'running', attempts = attempts + 1, worker = ?, lease = ?,
+                    lease_expires = ?, updated_at = ?
+                WHERE id = COALESCE(
+                    (SELECT id FROM tasks WHERE {batch_filter}state = 'pending' ORDER BY id LIMIT 1),
+                    (SELECT id FROM tasks WHERE {batch_filter}state = 'running' AND lease_expires < ?
+                     ORDER BY id LIMIT 1)
+                )
+                RETURNING *
+                """,
+                [worker, uuid.uuid4().hex, now + self.lease_seconds, now, *params, *params, now],
+            ).fetchone()
+        return dict(row) if row else None
+
+    def renew(self, tasks):
+        """Extends the leases of ``tasks`` that their worker still holds."""
+        expires = time.time() + self.lease_seconds
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE tasks SET lease_expires = ? WHERE id = ? AND lease = ?",
+                [(expires, task["id"], task["lease"]) for task in tasks],
+            )
+
+    def complete(self, task, result):
+        """Records ``result`` (any JSON value; None for "nothing found") if ``task``'s lease is still held."""
+        return self._finish(task, "done", result=json.dumps(result))
+
+    def fail(self, task, error):
+        """Puts ``task`` back in the queue, or marks it failed once it has used up its attempts."""
+        state = "failed" if task["attempts"] >= self.max_attempts else "pending"
+        return self._finish(task, state, error=error)
+
+    def _finish(self, task, state, result=None, error=None):
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                """
+                UPDATE tasks SET state = ?, result = ?, error = ?, lease = NULL, lease_expires = NULL,
+                    updated_at = ?
+                WHERE id = ? AND lease = ?
+                """,
+                (state, result, error, time.time(), task["id"], task["lease"]),
+            )
+        # False if the lease expired and another worker took the task over.
+        return cursor.rowcount == 1
+
+    def retry_failed(self, batch_id):
+        """Gives every failed task in the batch a fresh set of attempts."""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE tasks SET state = 'pending', attempts = 0, updated_at = ? WHERE batch_id = ? AND state = 'failed'",
+                (time.time(), batch_id),
+            )
+
+    def progress(self, batch_id):
+        """Task counts by state, plus ``total``."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT state, COUNT(*) FROM tasks WHERE batch_id = ? GROUP BY state", (batch_id,)
+            ).fetchall()
+        counts = dict.fromkeys(STATES, 0)
+        counts.update({state: count for state, count in rows})
+        counts["total"] = sum(counts[state] for state in STATES)
+        return counts
+
+    def results(self, batch_id):
+        """Finished and failed tasks of the batch in input order, with ``result`` decoded."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM tasks WHERE batch_id = ? AND state IN ('done', 'failed') ORDER BY id", (batch_id,)
+            ).fetchall()
+        tasks = [dict(row) for row in rows]
+        for task in tasks:
+            task["result"] = json.loads(task["result"]) if task["result"] else None
+        return tasks
+
+    def _reclaim_dead_workers(self):
+        """Expires leases held by processes on this host that are no longer running."""
+        prefix = f"{socket.gethostname()}:"
+        with self._lock:
+            workers = [
+                row[0]
+                for row in self._db.execute("SELECT DISTINCT worker FROM tasks WHERE state = 'running'")
+                if row[0] and row[0].startswith(prefix)
+            ]
+        dead = [worker for worker in workers if not _pid_alive(worker[len(prefix):])]
+        if dead:
+            with self._lock, self._db:
+                self._db.executemany(
+                    "UPDATE tasks SET lease_expires = 0 WHERE state = 'running' AND worker = ?",
+                    [(worker,) for worker in dead],
+                )
+
+
+def _pid_alive(pid):
+    if not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def work(job_queue, fetch, batch_id=None, concurrency=DEFAULT_CONCURRENCY, worker=None, initializer=None):
+    """
+    Runs ``fetch(query, platform)`` for queued tasks on ``concurrency`` threads until
+    none are left to claim, and yields ``(task, result)`` as each one finishes. A task
+    whose ``fetch`` raises is failed (and requeued while it has attempts left) and
+    yielded with a None result.
+
+    Leases of running tasks are renewed every ``HEARTBEAT_SECONDS`` until the generator
+    is closed (e.g. on a Streamlit rerun), which also stops new claims. Tasks already
+    running finish and are recorded if their lease has not been taken over by then.
+    """
+    worker = worker or default_worker_id()
+    finished = queue.Queue()
+    stop = threading.Event()
+    running = {}
+    running_lock = threading.Lock()
+
+    def loop():
+        while not stop.is_set():
+            task = job_queue.claim(worker, batch_id)
+            if task is None:
+                return
+            with running_lock:
+                running[task["id"]] = task
+            try:
+                result = fetch(task["query"], task["platform"])
+            except Exception as e:
+                job_queue.fail(task, f"{type(e).__name__}: {e}")
+                result = None
+            else:
+                job_queue.complete(task, result)
+            finally:
+                with running_lock:
+                    running.pop(task["id"], None)
+            finished.put((task, result))
+
+    def heartbeat():
+        while not stop.wait(min(HEARTBEAT_SECONDS, job_queue.lease_seconds / 2)):
+            with running_lock:
+                tasks = list(running.values())
+            if tasks:
+                job_queue.renew(tasks)
+
+    threading.Thread(target=heartbeat, name="job-heartbeat", daemon=True).start()
+
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency), initializer=initializer)
+    try:
+        loops = [pool.submit(loop) for _ in range(max(1, concurrency))]
+        while not (all(future.done() for future in loops) and finished.empty()):
+            try:
+                yield finished.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for future in loops:
+            future.result()
+    finally:
+        stop.set()
+        pool.shutdown(wait=False)
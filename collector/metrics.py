@@ -0,0 +1,138 @@
+"""
+Process-wide stage timings and counters for the lookup pipeline.
+
+Each stage of a lookup (search, page fetch, parse, download, store, ...) is
+timed with ``timed(stage, platform=...)`` into a histogram with fixed
+Prometheus-style buckets. Events such as cache hits, fallbacks to search and
+failures are tallied with ``count(name, **labels)``. Everything is in memory
+and per process. ``snapshot()`` returns it as a dict, and ``prometheus_text()``
+renders it in the Prometheus text exposition format. The apps draw the
+snapshot in their sidebar, and the CLI writes it out with ``--metrics``.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = "collector_"
+# Upper bounds of the histogram buckets, in seconds; a final +Inf bucket catches the rest.
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def count(name, amount=1, **labels):
+    """Adds ``amount`` to counter ``name`` with the given labels."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(stage, seconds, **labels):
+    """Records one ``seconds`` sample for ``stage``."""
+    key = _key(stage, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * (len(BUCKETS) + 1), "count": 0, "sum": 0.0}
+        index = next((i for i, bound in enumerate(BUCKETS) if seconds <= bound), len(BUCKETS))
+        histogram["buckets"][index] += 1
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+
+
+@contextmanager
+def timed(stage, **labels):
+    """Times the block into ``stage``'s histogram, whether it returns or raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start, **labels)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _quantile(histogram, q):
+    """Estimates a quantile as the upper bound of the bucket it falls in (None past the last bound)."""
+    target = q * histogram["count"]
+    seen = 0
+    for bound, bucket_count in zip(BUCKETS, histogram["buckets"]):
+        seen += bucket_count
+        if seen >= target:
+            return bound
+    return None
+
+
+def snapshot():
+    """
+    ``{"stages": [...], "counters": [...]}``. Each stage has its labels, ``count``,
+    ``sum`` and ``mean`` seconds, ``p50``/``p95`` bucket estimates and the per-bucket
+    counts keyed by upper bound. Each counter has its name, labels and ``value``.
+    """
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = [(key, dict(h, buckets=list(h["buckets"]))) for key, h in sorted(_histograms.items())]
+    stages = []
+    for (stage, labels), histogram in histograms:
+        bounds = [str(bound) for bound in BUCKETS] + ["+Inf"]
+        stages.append({
+            "stage": stage,
+            **dict(labels),
+            "count": histogram["count"],
+            "sum": round(histogram["sum"], 6),
+            "mean": round(histogram["sum"] / histogram["count"], 6),
+            "p50": _quantile(histogram, 0.5),
+            "p95": _quantile(histogram, 0.95),
+            "buckets": dict(zip(bounds, histogram["buckets"])),
+        })
+    return {
+        "stages": stages,
+        "counters": [{"name": name, **dict(labels), "value": value} for (name, labels), value in counters],
+    }
+
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{label}="{_escape(value)}"' for label, value in labels) + "}"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def prometheus_text():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = [(key, dict(h, buckets=list(h["buckets"]))) for key, h in sorted(_histograms.items())]
+    lines = []
+    if histograms:
+        name = f"{PREFIX}stage_seconds"
+        lines += [f"# HELP {name} Time spent in each stage of a profile lookup.", f"# TYPE {name} histogram"]
+        for (stage, labels), histogram in histograms:
+            labels = (("stage", stage),) + labels
+            cumulative = 0
+            for bound, bucket_count in zip([str(bound) for bound in BUCKETS] + ["+Inf"], histogram["buckets"]):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels_text(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels_text(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{_labels_text(labels)} {histogram['count']}")
+    typed = set()
+    for (name, labels), value in counters:
+        name = f"{PREFIX}{name}"
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_labels_text(labels)} {value}")
+    return "\n".join(lines) + "\n"
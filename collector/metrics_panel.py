@@ -0,0 +1,96 @@
+"""
+Streamlit rendering of ``collector.metrics``, shared by the apps' sidebars.
+
+This module and ``collector.widgets`` are the only collector modules that import
+Streamlit, so they are imported by the apps alone; the headless code records
+metrics without them.
+"""
+import json
+import time
+
+import streamlit as st
+
+from collector import metrics
+
+# Live panels are redrawn at most this often, in seconds.
+REFRESH_INTERVAL = 1.0
+
+
+def render(slot):
+    """Draws the stage histograms and counters into ``slot`` (an ``st.empty()``)."""
+    snapshot = metrics.snapshot()
+    with slot.container():
+        if not snapshot["stages"]:
+            st.caption("No lookups timed yet.")
+            return
+        st.dataframe(
+            [
+                {
+                    "Stage": stage["stage"],
+                    "Platform": stage.get("platform", ""),
+                    "Count": stage["count"],
+                    "Mean (s)": round(stage["mean"], 3),
+                    "p50 ≤ (s)": stage["p50"],
+                    "p95 ≤ (s)": stage["p95"],
+                    "Histogram": list(stage["buckets"].values()),
+                }
+                for stage in snapshot["stages"]
+            ],
+            column_config={
+                "Histogram": st.column_config.BarChartColumn(
+                    "Histogram", help="Samples per bucket, from ≤ 5 ms up to over 30 s", y_min=0
+                ),
+            },
+            hide_index=True,
+        )
+        st.dataframe(
+            [
+                {
+                    "Counter": counter["name"],
+                    "Labels": ", ".join(f"{k}={v}" for k, v in counter.items() if k not in ("name", "value")),
+                    "Value": counter["value"],
+                }
+                for counter in snapshot["counters"]
+            ],
+            hide_index=True,
+        )
+
+
+def live_renderer(slot):
+    """Returns a callable that redraws ``slot``, at most every ``REFRESH_INTERVAL`` seconds unless forced."""
+    last_drawn = [0.0]
+
+    def refresh(force=False):
+        now = time.monotonic()
+        if force or now - last_drawn[0] >= REFRESH_INTERVAL:
+            last_drawn[0] = now
+            render(slot)
+
+    return refresh
+
+
+def sidebar():
+    """
+    The "Operations panel" sidebar toggle: when on, an expander with the export buttons
+    and the live panel. Returns the panel's ``refresh(force=False)``, a no-op when off.
+    """
+    if not st.sidebar.toggle("📈 Operations panel"):
+        return lambda force=False: None
+    with st.sidebar.expander("📈 Stage timings", expanded=True):
+        export_buttons()
+        slot = st.empty()
+    return live_renderer(slot)
+
+
+def export_buttons():
+    """Download buttons for the current metrics as Prometheus text and JSON, and a reset button."""
+    col_prom, col_json, col_reset = st.columns(3)
+    col_prom.download_button(
+        "Prometheus", data=lambda: metrics.prometheus_text(), file_name="collector_metrics.prom", mime="text/plain"
+    )
+    col_json.download_button(
+        "JSON", data=lambda: json.dumps(metrics.snapshot(), indent=2), file_name="collector_metrics.json",
+        mime="application/json",
+    )
+    if col_reset.button("Reset", help="Clears the timings and counters of this server process"):
+        metrics.reset()
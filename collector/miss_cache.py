@@ -0,0 +1,33 @@
+"""
+Shared, persistent cache of lookups known to come up empty.
+
+Entries are keyed like the search cache, by (input, platform), and hold the
+reason the lookup failed. Misses expire much sooner than search results,
+since a profile that does not exist today may be created tomorrow.
+"""
+import threading
+
+from collector.ttl_cache import TTLCache
+
+MISS_TTL = 24 * 60 * 60
+MISS_MAX_ENTRIES = 50000
+
+# The platform's usual address for the username is a 404. A search may still
+# find the profile elsewhere, so later lookups skip straight to the search.
+DIRECT_NOT_FOUND = "direct_404"
+# The web search returned no likely profile.
+SEARCH_FOUND_NOTHING = "search_found_nothing"
+# The profile page was found but had no usable image.
+NO_IMAGE = "no_image"
+
+_lock = threading.Lock()
+_cache = None
+
+
+def get_miss_cache():
+    """Returns the process-wide miss cache, opening it on first use."""
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = TTLCache("profile_misses", ttl=MISS_TTL, max_entries=MISS_MAX_ENTRIES)
+    return _cache
@@ -0,0 +1,243 @@
+"""
+Post-download normalization: real formats, bounded sizes, no metadata.
+
+Fetchers save whatever bytes the site served under a ``.jpg`` name: PNG
+og:images, WebP from CDNs, ICO favicons. This stage sniffs the real format,
+decodes, shrinks anything over ``max_edge``, drops EXIF/ICC/comments and
+re-encodes to one target format and quality. The file is then stored again
+under a name with the matching extension. Decoding and encoding are CPU-bound,
+so they run on a process pool; the store bookkeeping stays in this process.
+
+SVG cannot be rasterized with Pillow alone, so SVG files are only renamed to
+``.svg``. A file already in the target format, within ``max_edge`` and free
+of metadata keeps its bytes when re-encoding would not make it smaller.
+
+    python -m collector.normalize [--max-edge 1024] [--format JPEG] [--quality 85] images
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from collector import metrics
+from collector.image_store import get_store
+
+MAX_EDGE = 1024
+TARGET_FORMAT = "JPEG"
+QUALITY = 85
+WORKERS = os.cpu_count() or 2
+EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp", "SVG": ".svg"}
+TARGET_FORMATS = ("JPEG", "WEBP", "PNG")
+# Metadata keys Pillow would otherwise carry into the new file.
+METADATA_KEYS = ("exif", "icc_profile", "comment", "xmp", "XML:com.adobe.xmp")
+
+_lock = threading.Lock()
+_pool = None
+
+
+def get_pool():
+    """The shared process pool, started on first use."""
+    global _pool
+    with _lock:
+        if _pool is None:
+            # Spawned, not forked: the apps fork from processes with live threads and sockets.
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _discard_pool(pool):
+    """Drops ``pool`` after one of its workers died, so ``get_pool`` starts a new one."""
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def sniff_format(path):
+    """The real format of the file at ``path`` (Pillow's name, or "SVG"), or None if it is not an image."""
+    try:
+        with Image.open(path) as image:
+            return image.format
+    except (UnidentifiedImageError, OSError, ValueError):
+        pass
+    with open(path, "rb") as f:
+        head = f.read(1024).lstrip().lower()
+    if head.startswith(b"<svg") or (head.startswith(b"<?xml") and b"<svg" in head):
+        return "SVG"
+    return None
+
+
+def filename_for(filename, image_format):
+    """``filename`` with the extension of ``image_format``."""
+    return os.path.splitext(filename)[0] + EXTENSIONS.get(image_format, os.path.splitext(filename)[1])
+
+
+def transcode(source, dest_dir, max_edge=MAX_EDGE, target_format=TARGET_FORMAT, quality=QUALITY):
+    """
+    Re-encodes ``source`` into a new temp file in ``dest_dir``. Runs in a pool worker.
+
+    Returns ``{"path", "format_in", "format_out", "bytes_in", "bytes_out", "seconds"}``,
+    where ``path`` is None if the original bytes should be kept as they are.
+    """
+    started = time.perf_counter()
+    format_in = sniff_format(source)
+    bytes_in = os.path.getsize(source)
+    result = {"path": None, "format_in": format_in, "format_out": format_in, "bytes_in": bytes_in, "bytes_out": bytes_in}
+    if format_in in (None, "SVG"):
+        result["seconds"] = time.perf_counter() - started
+        return result
+
+    with Image.open(source) as image:
+        has_metadata = any(image.info.get(key) for key in METADATA_KEYS)
+        oversized = max(image.size) > max_edge
+        if target_format == "JPEG":
+            image.draft("RGB", (max_edge, max_edge))
+        # Honour the EXIF orientation before the EXIF block is dropped. Animated
+        # images keep their first frame, which is all an avatar needs.
+        frame = ImageOps.exif_transpose(image)
+        frame.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        frame = _convert_mode(frame, target_format)
+
+    fd, path = tempfile.mkstemp(dir=dest_dir, suffix=".part")
+    with os.fdopen(fd, "wb") as f:
+        options = {"optimize": True}
+        if target_format in ("JPEG", "WEBP"):
+            options["quality"] = quality
+        # A fresh image carries no metadata unless it is passed to save().
+        frame.save(f, target_format, **options)
+    bytes_out = os.path.getsize(path)
+    if format_in == target_format and not oversized and not has_metadata and bytes_out >= bytes_in:
+        os.remove(path)
+    else:
+        result.update(path=path, format_out=target_format, bytes_out=bytes_out)
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def _convert_mode(image, target_format):
+    """``image`` in a mode ``target_format`` can store; JPEG flattens transparency onto white."""
+    if target_format == "JPEG":
+        if image.mode in ("RGBA", "LA", "P", "PA"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            return background
+        return image if image.mode in ("RGB", "L") else image.convert("RGB")
+    if image.mode not in ("RGB", "RGBA", "L", "LA"):
+        return image.convert("RGBA")
+    return image
+
+
+def normalize_images(filepaths, folder, max_edge=MAX_EDGE, target_format=TARGET_FORMAT, quality=QUALITY):
+    """
+    Normalizes the saved images ``filepaths`` in ``folder`` on the process pool and
+    stores each result under its corrected name, removing the old name. Yields a report
+    per file as it finishes: ``source``, the new ``filepath``, the ``digest`` of the
+    original bytes, ``format_in``, ``format_out``, ``bytes_in``, ``bytes_out``,
+    ``skipped`` (not an image, left as it was) and ``error`` (the file is left as it
+    was when set).
+    """
+    store = get_store(folder)
+    pool = get_pool()
+    futures = {
+        pool.submit(transcode, filepath, store.incoming_dir, max_edge, target_format, quality): filepath
+        for filepath in dict.fromkeys(filepaths)
+    }
+    counted = set()
+    for future in as_completed(futures):
+        source = futures[future]
+        try:
+            result = future.result()
+        except BrokenProcessPool as e:
+            # A worker was killed (e.g. out of memory): the rest of this batch fails with
+            # it, and the next batch gets a new pool.
+            _discard_pool(pool)
+            metrics.count("failures_total", platform="normalize", reason=type(e).__name__)
+            yield {"source": source, "filepath": source, "skipped": False, "error": f"Worker crashed: {e}"}
+            continue
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            metrics.count("failures_total", platform="normalize", reason=type(e).__name__)
+            yield {"source": source, "filepath": source, "skipped": False, "error": str(e)}
+            continue
+        metrics.observe("normalize", result["seconds"])
+        old_digest = store.digest_for(source)
+        if result["format_in"] is None:
+            metrics.count("normalize_skipped_total")
+            yield dict(result, source=source, filepath=source, digest=old_digest, skipped=True, error=None)
+            continue
+        filename = filename_for(os.path.basename(source), result["format_out"])
+        if result["path"]:
+            # The new bytes are the same picture as the old blob; link them as themselves.
+            filepath = store.save_file(result["path"], filename, near_duplicates=False)
+        elif filename != os.path.basename(source):
+            filepath = store.rename(source, filename)
+        else:
+            filepath = source
+        if filepath != source:
+            store.remove(source)
+        # Drop the original bytes unless another name still links to them.
+        store.prune(old_digest)
+        # Two counters rather than their difference: a re-encode can grow a file, and a counter
+        # only goes up. Names sharing one blob count its bytes once.
+        if old_digest not in counted:
+            counted.add(old_digest)
+            metrics.count("normalized_bytes_in_total", result["bytes_in"])
+            metrics.count("normalized_bytes_out_total", result["bytes_out"])
+        yield dict(result, source=source, filepath=filepath, digest=old_digest, skipped=False, error=None)
+
+
+def summarize(reports):
+    """
+    Totals for one batch of ``normalize_images`` reports, including ``bytes_saved``.
+    Names sharing one blob count its bytes once.
+    """
+    done = [report for report in reports if not report["error"] and not report["skipped"]]
+    blobs = {report["digest"] or report["source"]: report for report in done}.values()
+    bytes_in = sum(report["bytes_in"] for report in blobs)
+    bytes_out = sum(report["bytes_out"] for report in blobs)
+    failed = sum(bool(report["error"]) for report in reports)
+    return {
+        "files": len(done),
+        "converted": sum(report["format_in"] != report["format_out"] for report in done),
+        "skipped": len(reports) - len(done) - failed,
+        "failed": failed,
+        "bytes_in": bytes_in,
+        "bytes_out": bytes_out,
+        "bytes_saved": bytes_in - bytes_out,
+    }
+
+
+def describe(totals):
+    """A one-line account of ``summarize`` totals, for logs and captions."""
+    line = (
+        f"{totals['files']} image(s) normalized, {totals['converted']} converted: "
+        f"{totals['bytes_in'] / 1024:,.0f} KB → {totals['bytes_out'] / 1024:,.0f} KB "
+        f"({totals['bytes_saved'] / 1024:,.0f} KB saved)"
+    )
+    if totals["skipped"]:
+        line += f", {totals['skipped']} skipped (not images)"
+    return line + (f", {totals['failed']} failed" if totals["failed"] else "")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m collector.normalize", description=__doc__.split("\n\n")[0])
+    parser.add_argument("folders", nargs="*", default=["images"])
+    parser.add_argument("--max-edge", type=int, default=MAX_EDGE)
+    parser.add_argument("--format", dest="target_format", choices=TARGET_FORMATS, default=TARGET_FORMAT)
+    parser.add_argument("--quality", type=int, default=QUALITY)
+    args = parser.parse_args(argv)
+    for folder in args.folders:
+        filepaths = [entry.path for entry in os.scandir(folder) if entry.is_file()]
+        reports = list(normalize_images(filepaths, folder, args.max_edge, args.target_format, args.quality))
+        print(f"{folder}: {describe(summarize(reports))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+PDF splitting that holds as little of the document in memory as it can.
+
+An upload is written once to a spool directory, named by its SHA-256, and
+``PdfDocument`` reads it from that file rather than from a copy in memory.
+The page count comes from the page tree's ``/Count``, so opening a
+500-page file resolves no pages at all; page objects are loaded the first
+time a split copies them. Split output goes to a ``SpooledTemporaryFile``,
+which moves to disk once it passes ``SPOOL_MAX_BYTES``, or to a file.
+Everything under ``PDF_CACHE_DIR`` is disposable: ``prune_cache`` removes
+files unused for ``CACHE_MAX_AGE_SECONDS`` and then the least recently used
+ones until the cache fits in ``CACHE_MAX_BYTES``.
+
+``split_to_zip`` cuts many PDFs by one range expression ("1-3,7,20-" or
+"every 10 pages") at once. Each file is split on a process pool, its parts
+are written to temp files, and the parent moves every part into a single
+ZIP on disk as soon as it is ready. Only ``WORKERS * 2`` files are in flight
+at a time, so memory stays bounded however many or however large the inputs.
+"""
+import hashlib
+import mmap
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from PyPDF2 import PdfReader, PdfWriter
+
+from collector import CACHE_ROOT
+
+PDF_CACHE_DIR = os.path.join(CACHE_ROOT, "pdf")
+# Split output stays in memory up to this size, then spills to a temp file.
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+CACHE_MAX_AGE_SECONDS = 24 * 60 * 60
+CACHE_MAX_BYTES = 1024 ** 3
+WORKERS = os.cpu_count() or 2
+
+_EVERY = re.compile(r"every\s+(\d+)(?:\s+pages?)?", re.IGNORECASE)
+_RANGE = re.compile(r"(\d*)\s*-\s*(\d*)|(\d+)")
+
+_lock = threading.Lock()
+_pool = None
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def spool_upload(data, digest=None, cache_dir=PDF_CACHE_DIR):
+    """Writes ``data`` to ``cache_dir`` under its content hash, unless it is already there; returns the path."""
+    digest = digest or content_hash(data)
+    path = os.path.join(cache_dir, f"{digest}.pdf")
+    if os.path.exists(path):
+        # Marks it as recently used for ``prune_cache``.
+        os.utime(path)
+    else:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return path
+
+
+def prune_cache(cache_dir=PDF_CACHE_DIR, max_age=CACHE_MAX_AGE_SECONDS, max_bytes=CACHE_MAX_BYTES):
+    """
+    Removes the files in ``cache_dir`` and its subdirectories (one level down) not
+    modified for ``max_age`` seconds, then the oldest of the rest until they total at
+    most ``max_bytes``. Files still being written (``.part``) are left alone. An open
+    ``PdfDocument`` keeps working after its file is removed; a later upload of the same
+    bytes spools it again.
+    """
+    files = []
+    directories = [cache_dir]
+    for directory in directories:
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if directory == cache_dir:
+                    directories.append(entry.path)
+            elif not entry.name.endswith(".part"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+    files.sort(reverse=True)
+    cutoff = time.time() - max_age
+    total = 0
+    for mtime, size, path in files:
+        total += size
+        if mtime < cutoff or total > max_bytes:
+            try:
+                os.remove(path)
+            except OSError:
+                # Already gone, or open elsewhere on a platform that forbids removing it.
+                pass
+
+
+def parse_ranges(expression, page_count):
+    """
+    The parts an expression cuts a ``page_count``-page document into, as ranges of
+    0-based page numbers. The expression is either "every N pages" (fixed-size chunks)
+    or comma-separated 1-based pages and ranges, one part each: "1-3,7,20-". An open
+    end runs to the first or last page. Ranges reaching past the end are cut short and
+    ranges starting past it are dropped, so one expression fits files of any length.
+    A part asked for twice is listed once. Raises ValueError for anything else.
+    """
+    expression = expression.strip()
+    every = _EVERY.fullmatch(expression)
+    if every:
+        size = int(every.group(1))
+        if size < 1:
+            raise ValueError("Chunk size must be at least 1 page.")
+        return [range(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+    parts = []
+    for term in expression.split(","):
+        term = term.strip()
+        match = _RANGE.fullmatch(term)
+        if not term or not match or match.group(0) == "-":
+            raise ValueError(f"Not a page or page range: {term!r}")
+        if match.group(3):
+            first = last = int(match.group(3))
+        else:
+            first = int(match.group(1)) if match.group(1) else 1
+            last = int(match.group(2)) if match.group(2) else page_count
+        if first < 1 or (match.group(2) and last < first):
+            raise ValueError(f"Not a valid page range: {term!r}")
+        part = range(first - 1, min(last, page_count))
+        if first <= page_count and part not in parts:
+            parts.append(part)
+    return parts
+
+
+class PdfDocument:
+    """A parsed PDF read lazily from a file on disk. Safe to share between sessions."""
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            # Memory-mapped, the reader's many small seeks and reads are plain memory
+            # accesses, and the pages it never touches are never read in.
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._reader = PdfReader(self._map)
+        # The reader seeks around the one shared mapping.
+        self._lock = threading.Lock()
+        self.page_count = self._count_pages()
+
+    @classmethod
+    def from_bytes(cls, data, digest=None, cache_dir=PDF_CACHE_DIR):
+        """Spools ``data`` to ``cache_dir`` under its content hash (once) and opens it."""
+        return cls(spool_upload(data, digest, cache_dir))
+
+    def _count_pages(self):
+        with self._lock:
+            try:
+                return int(self._reader.trailer["/Root"]["/Pages"]["/Count"])
+            except (KeyError, TypeError, ValueError):
+                # No usable /Count: walk the page tree instead.
+                return len(self._reader.pages)
+
+    def write_pages(self, page_numbers, output=None):
+        """
+        Copies the 0-based ``page_numbers`` into a new PDF written to ``output``, by
+        default a new ``SpooledTemporaryFile``. Returns ``output`` rewound; the caller
+        closes it.
+        """
+        writer = PdfWriter()
+        if output is None:
+            output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        with self._lock:
+            for number in page_numbers:
+                writer.add_page(self._reader.pages[number])
+            writer.write(output)
+        output.seek(0)
+        return output
+
+    def save_pages(self, page_numbers, path):
+        """``write_pages`` into the file ``path``, unless it already exists; returns ``path``."""
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".part")
+        try:
+            with os.fdopen(fd, "w+b") as f:
+                self.write_pages(page_numbers, f)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path
+
+    def close(self):
+        # Waits for a split in progress on another thread.
+        with self._lock:
+            self._map.close()
+
+
+def get_pool():
+    """The shared process pool for ``split_to_zip``, started on first use."""
+    global _pool
+    with _lock:
+        if _pool is None:
+            # Spawned, not forked: the apps fork from processes with live threads and sockets.
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _discard_pool(pool):
+    """Drops ``pool`` after one of its workers died, so ``get_pool`` starts a new one."""
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def part_name(name, part):
+    """The archive name of ``part`` (a 0-based page range) of the file ``name``."""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    pages = f"p{part.start + 1}" if len(part) == 1 else f"p{part.start + 1}-{part.stop}"
+    return f"{stem}/{stem}_{pages}.pdf"
+
+
+def split_file(name, path, expression, out_dir):
+    """
+    Splits the PDF at ``path`` by ``expression`` into files in ``out_dir``. Runs in a
+    pool worker. Returns ``{"name", "pages", "parts": [(arcname, part path)], "error"}``.
+    Any failure is reported in ``error``: a malformed file must not stop the batch.
+    """
+    result = {"name": name, "pages": 0, "parts": [], "error": None}
+    try:
+        document = PdfDocument(path)
+    except Exception as e:
+        return dict(result, error=f"Could not read PDF: {e}")
+    try:
+        result["pages"] = document.page_count
+        parts = parse_ranges(expression, document.page_count)
+        if not parts:
+            return dict(result, error="No pages in the selected ranges.")
+        for part in parts:
+            fd, part_path = tempfile.mkstemp(dir=out_dir, suffix=".pdf")
+            with os.fdopen(fd, "w+b") as f:
+                document.write_pages(part, f)
+            result["parts"].append((part_name(name, part), part_path))
+    except Exception as e:
+        # E.g. IndexError when /Count overstates the pages, KeyError for a broken object.
+        for _, part_path in result["parts"]:
+            os.remove(part_path)
+        return dict(result, parts=[], error=str(e))
+    finally:
+        document.close()
+    return result
+
+
+def split_to_zip(sources, expression, zip_path, workers=WORKERS):
+    """
+    Splits every ``(name, path)`` in ``sources`` by ``expression`` on the process pool
+    and streams the parts into one ZIP at ``zip_path``. Yields each file's result (see
+    ``split_file``, with ``parts`` as archive names) as it is added. At most
+    ``workers * 2`` files are split ahead of the archive at any time.
+    """
+    parse_ranges(expression, 1)  # Fail before any work is queued.
+    sources = iter(sources)
+    stems = set()
+    # Future -> (name, the pool it was submitted to).
+    pending = {}
+    zip_dir = os.path.dirname(os.path.abspath(zip_path))
+    fd, tmp_path = tempfile.mkstemp(dir=zip_dir, suffix=".part")
+    try:
+        with tempfile.TemporaryDirectory(dir=zip_dir) as out_dir, \
+                os.fdopen(fd, "wb") as f, ZipFile(f, "w", compression=ZIP_DEFLATED) as archive:
+            while True:
+                while len(pending) < max(1, workers) * 2:
+                    source = next(sources, None)
+                    if source is None:
+                        break
+                    name = _unique_name(source[0], stems)
+                    pool = get_pool()
+                    pending[pool.submit(split_file, name, source[1], expression, out_dir)] = (name, pool)
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, pool = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as e:
+                        # A worker was killed (e.g. out of memory); the files after it go to a new pool.
+                        _discard_pool(pool)
+                        yield {"name": name, "pages": 0, "parts": [], "error": f"Worker crashed: {e}"}
+                        continue
+                    for arcname, part_path in result["parts"]:
+                        archive.write(part_path, arcname=arcname)
+                        os.remove(part_path)
+                    yield dict(result, parts=[arcname for arcname, _ in result["parts"]])
+        os.replace(tmp_path, zip_path)
+    finally:
+        # Closed early (e.g. a Streamlit rerun): drop the work not yet started and the partial archive.
+        for future in pending:
+            future.cancel()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _unique_name(name, stems):
+    """``name``, or "name (2).pdf" and so on if an earlier file in the batch had its stem."""
+    stem, ext = os.path.splitext(os.path.basename(name))
+    candidate, copy = stem, 1
+    while candidate.lower() in stems:
+        copy += 1
+        candidate = f"{stem} ({copy})"
+    stems.add(candidate.lower())
+    return candidate + ext
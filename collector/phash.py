@@ -0,0 +1,79 @@
+"""
+Perceptual hashing and a BK-tree for near-duplicate image lookups.
+
+The same avatar served at another CDN size or recompressed has different
+bytes but nearly the same 64-bit difference hash (dHash). A BK-tree over
+those hashes finds every stored image within a Hamming radius in roughly
+logarithmic time, without comparing against every image on disk.
+"""
+from PIL import Image, UnidentifiedImageError
+
+HASH_SIZE = 8
+# Hashes this many bits apart (out of 64) or fewer are treated as the same picture.
+DEFAULT_RADIUS = 6
+
+
+def dhash(fp, hash_size=HASH_SIZE):
+    """The difference hash of an image file or file-like object, as an int."""
+    with Image.open(fp) as image:
+        # Let JPEG decode at reduced size; the hash only needs a tiny greyscale copy.
+        image.draft("L", ((hash_size + 1) * 4, hash_size * 4))
+        pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def dhash_file(fp):
+    """Like ``dhash``, but returns None for anything Pillow cannot or will not decode."""
+    try:
+        return dhash(fp)
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """A Burkhard-Keller tree of integer hashes under Hamming distance."""
+
+    def __init__(self):
+        self._root = None
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        if self._root is None:
+            self._root = (value, [item], {})
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, [item], {})
+                return
+            node = child
+
+    def search(self, value, radius):
+        """Returns ``(distance, item)`` pairs within ``radius`` of ``value``, closest first."""
+        matches = []
+        stack = [self._root] if self._root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                matches.extend((distance, item) for item in node[1])
+            # Triangle inequality: only subtrees at distance-radius..distance+radius can match.
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return sorted(matches, key=lambda match: match[0])
@@ -0,0 +1,425 @@
+"""
+Headless profile lookup: name, username or URL -> saved profile image.
+
+This is the fetch logic the Streamlit apps used to carry inline, with the UI
+calls replaced by an ``on_event(level, message)`` callback. ``level`` is one of
+``EVENT_LEVELS``; the apps map it onto ``st.info``/``st.warning``/..., and the
+CLI (``python -m collector``) onto logging. Every stage is timed, and cache
+hits, search fallbacks and failures are counted, in ``collector.metrics``.
+
+What to read from a page is declared per platform as ``image_rules`` (see
+``collector.extract``), and every rule is collected in a single pass.
+
+Lookups that come up empty are remembered in ``collector.miss_cache``, so a
+resubmitted miss returns at once instead of spending request and search budget.
+"""
+import json
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urljoin, urlparse
+
+import requests
+from duckduckgo_search import DDGS
+
+from collector import http_client, metrics, ratelimit
+from collector.extract import parse_html, rank
+from collector.image_store import get_store
+from collector.miss_cache import DIRECT_NOT_FOUND, NO_IMAGE, SEARCH_FOUND_NOTHING, get_miss_cache
+from collector.search_cache import cache_key, get_search_cache
+
+SAVE_FOLDER = "images"
+EVENT_LEVELS = ["debug", "info", "success", "warning", "error"]
+
+# Class fragments of <img> tags that usually hold the avatar.
+PROFILE_IMG_CLASSES = ("avatar", "profile", "author")
+# Where any profile page may keep the person's picture, best first. Only the page's
+# <head> is fetched unless it has none of the metadata, so those rules come first and
+# the <img> ones only decide when the whole page had to be read. Platforms add their
+# own markup after these, and the favicon is always the last resort.
+IMAGE_RULES = [
+    ("meta", "og:image"),
+    ("meta", "twitter:image"),
+    ("json_ld_image", None),
+    ("img_class", PROFILE_IMG_CLASSES),
+]
+ICON_RULE = ("icon", None)
+# What extract_display_name reads.
+NAME_RULES = [("json_ld", None), ("meta", "og:title"), ("meta", "og:site_name"), ("h1", None), ("title", None)]
+
+PLATFORMS = {
+    "substack": {
+        "domain": "substack.com",
+        "url_template": lambda user: f"https://{user}.substack.com",
+        "image_rules": IMAGE_RULES + [("img_src", ("profile", "avatar")), ICON_RULE],
+    },
+    "medium": {
+        "domain": "medium.com",
+        "url_template": lambda user: f"https://medium.com/@{user.strip('@')}",
+        # Medium's CDN resizer, then an <img> captioned with the username.
+        "image_rules": IMAGE_RULES + [("img_src", ("medium.com/v2/resize:",)), ("img_alt", "{username}"), ICON_RULE],
+    },
+}
+# Search hits under these paths are listings, not a person's profile.
+NON_PROFILE_PATHS = ["/about", "/topics", "/search", "/tag"]
+# Statuses that mean a page does not exist, as opposed to being blocked or throttled.
+MISSING_STATUSES = {404, 410}
+# Seconds a username's direct address gets to answer before a web search is started
+# alongside it; None waits for it and only searches if the page is missing.
+HEDGE_DELAY = 2.0
+
+
+def _ignore_event(level, message):
+    pass
+
+
+def find_profile_url(query, platform_name, on_event=None, record_miss=True):
+    """
+    Uses DuckDuckGo to find a profile URL by trying multiple search patterns. A search
+    that finds nothing is remembered in the miss cache unless ``record_miss`` is False.
+    """
+    on_event = on_event or _ignore_event
+    search_cache = get_search_cache()
+    key = cache_key(query, platform_name)
+    cached_url = search_cache.get(key)
+    if cached_url:
+        metrics.count("cache_hits_total", cache="search")
+        on_event("info", f"Using cached profile for '{query}' on {platform_name}: {cached_url}")
+        return cached_url
+    miss_cache = get_miss_cache()
+    if miss_cache.get(key) == SEARCH_FOUND_NOTHING:
+        metrics.count("cache_hits_total", cache="miss")
+        on_event("info", f"A recent search for '{query}' on {platform_name} found nothing; not searching again.")
+        return None
+    on_event("info", f"Searching the web for '{query}' on {platform_name}...")
+    site_domain = f"{platform_name.lower()}.com"
+    search_queries = [
+        f'"{query}" site:{site_domain}',
+        f'"{query}" {platform_name} author profile'
+    ]
+    # The patterns run at once; their hits are still taken in order, so a hit from the
+    # more precise first pattern wins over the second.
+    pool = ThreadPoolExecutor(max_workers=len(search_queries))
+    failed = False
+    try:
+        searches = []
+        for i, search_query in enumerate(search_queries):
+            on_event("debug", f"Attempting search ({i+1}/{len(search_queries)}): `{search_query}`")
+            searches.append(pool.submit(_search, search_query, site_domain, platform_name.lower()))
+        for search in searches:
+            try:
+                url = search.result()
+            except Exception as e:
+                failed = True
+                metrics.count("search_errors_total", platform=platform_name.lower())
+                on_event("warning", f"Web search encountered an error: {e}")
+                continue
+            if url:
+                on_event("success", f"Found potential profile: {url}")
+                search_cache.set(key, url)
+                return url
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    if not failed and record_miss:
+        # Only searches that ran to the end prove there is nothing to find.
+        miss_cache.set(key, SEARCH_FOUND_NOTHING)
+    on_event("warning", f"Could not find a likely profile for '{query}' in search results.")
+    return None
+
+
+def collect_profile(doc, base_url, image_rules):
+    """Reads every image rule and the display name lookups from ``doc`` in one pass."""
+    return doc.collect(list(image_rules) + NAME_RULES, username=url_username(base_url))
+
+
+def _search(search_query, site_domain, platform):
+    """Runs one search pattern and returns the first result that looks like a profile, or None."""
+    with DDGS() as ddgs, metrics.timed("search", platform=platform):
+        results = ratelimit.ddgs_call(lambda: ddgs.text(search_query, max_results=3))
+    for result in results:
+        url = result.get('href')
+        if url and site_domain in urlparse(url).netloc:
+            path = urlparse(url).path
+            if len(path) > 1 and not any(page in path.lower() for page in NON_PROFILE_PATHS):
+                return url
+    return None
+
+
+def extract_image_url(found, base_url, image_rules):
+    """The best image in ``found`` (from ``collect_profile``) by rule order, as an absolute URL."""
+    image = rank(found, image_rules)
+    return urljoin(base_url, image) if image else None
+
+
+def extract_display_name(found):
+    """Finds the display name in ``found`` (from ``collect_profile``) using a priority list of common locations."""
+    json_ld = found.get(("json_ld", None))
+    if json_ld:
+        try:
+            data = json.loads(json_ld)
+            if data.get("@type") == "ProfilePage" and data.get("mainEntity"):
+                return data["mainEntity"].get("name", "").strip()
+            if data.get("author") and data["author"].get("name"):
+                return data["author"]["name"].strip()
+        except (json.JSONDecodeError, AttributeError):
+            pass
+    og_title = found.get(("meta", "og:title"))
+    if og_title:
+        name = og_title
+        og_site_name = found.get(("meta", "og:site_name"))
+        if og_site_name:
+            name = name.replace(f"| {og_site_name}", "")
+            name = name.replace(f"- {og_site_name}", "")
+        return name.strip()
+    h1_string = found.get(("h1", None))
+    if h1_string:
+        return h1_string.strip()
+    title_string = found.get(("title", None))
+    if title_string:
+        return title_string.split('|')[0].strip()
+    return None
+
+
+def platform_for_url(url):
+    """The known platform whose domain ``url`` is on, or None (e.g. a custom domain)."""
+    netloc = urlparse(url).netloc.lower()
+    for name, config in PLATFORMS.items():
+        if netloc == config["domain"] or netloc.endswith("." + config["domain"]):
+            return name
+    return None
+
+
+def url_username(url):
+    """The username in a profile URL: its ``@handle`` path segment, else its first host label."""
+    parsed = urlparse(url)
+    segments = [segment for segment in parsed.path.split('/') if segment]
+    if platform_for_url(url) != "substack" and segments and segments[0].startswith('@'):
+        return segments[0].strip('@')
+    return parsed.netloc.split('.')[0]
+
+
+def profile_filename(user_input, platform):
+    """``<platform>_<username>.jpg``, with the username taken from the query or URL."""
+    if user_input.startswith("http"):
+        username = url_username(user_input)
+    else:
+        username = user_input.split('.')[0]
+    username = re.sub(r"[^\w-]", "_", username.lower().strip('@').replace(' ', '_'))
+    return f"{platform}_{username}.jpg"
+
+
+def fetch_profile(user_input, platform, save_folder=SAVE_FOLDER, on_event=None, hedge_delay=HEDGE_DELAY):
+    """
+    Finds, downloads and saves the profile image for ``user_input`` on ``platform``.
+
+    A URL is fetched directly, a single-word username is tried at the platform's usual
+    address, and anything else is looked up with a web search. If the usual address has
+    not answered within ``hedge_delay`` seconds, the search is started alongside it (see
+    ``HEDGE_DELAY``). Returns a dict with ``query``, ``platform``, ``profile_url``,
+    ``image_url``, ``filepath``, ``filename``, ``display_name`` and ``near_duplicate_of``,
+    or None if nothing was saved.
+    """
+    with metrics.timed("lookup", platform=platform):
+        result = _fetch_profile(user_input, platform, save_folder, on_event or _ignore_event, hedge_delay)
+    metrics.count("lookups_total", platform=platform, outcome="saved" if result else "not_saved")
+    return result
+
+
+def _fail(platform, reason):
+    metrics.count("failures_total", platform=platform, reason=reason)
+
+
+def _fetch_page(url, platform):
+    with metrics.timed("page_fetch", platform=platform):
+        return http_client.get_head(url, allow_redirects=True, cache=True)
+
+
+def _is_not_found(response):
+    # Only a missing page means the guess was wrong; throttling or an outage
+    # (already retried by the rate limiter) would fail the search just the same.
+    return 400 <= response.status_code < 500 and response.status_code != 429
+
+
+def _search_page(user_input, platform, on_event, record_miss=True):
+    """Finds ``user_input`` with a web search and fetches the hit as ``(response, doc)``, or returns None."""
+    search_url = find_profile_url(user_input, platform.capitalize(), on_event, record_miss)
+    return _fetch_page(search_url, platform) if search_url else None
+
+
+def _resolve_guess(user_input, platform, direct_url, on_event, hedge_delay, on_missing):
+    """
+    Fetches the guessed ``direct_url`` as ``(response, doc)``, falling back to a web search
+    if the page is not found. With a ``hedge_delay``, a guess that has not answered within
+    that many seconds gets the search started alongside it. The first of the two to reach
+    a working page wins, and the other is cancelled, or abandoned if already in flight.
+    ``on_missing`` is called if the guessed page turns out not to exist.
+    """
+    # The search runs on a pool thread, so its events are replayed here, on the caller's
+    # thread (Streamlit can only draw from the script's own threads).
+    search_events = []
+    pool = ThreadPoolExecutor(max_workers=2)
+    direct = pool.submit(_fetch_page, direct_url, platform)
+    search = None
+    direct_result = direct_error = search_result = None
+    try:
+        wait([direct], timeout=hedge_delay)
+        if not direct.done():
+            on_event("info", f"No answer from {direct_url} after {hedge_delay:g}s; searching alongside it...")
+            metrics.count("hedged_searches_total", platform=platform)
+            # Only a hedge: the guess may still succeed, so finding nothing proves nothing.
+            search = pool.submit(
+                _search_page, user_input, platform, lambda *event: search_events.append(event), record_miss=False
+            )
+        pending = {direct, search} - {None}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            if direct in done:
+                try:
+                    direct_result = direct.result()
+                except requests.RequestException as e:
+                    if not search:
+                        raise
+                    direct_error = e
+                else:
+                    response = direct_result[0]
+                    if response.status_code in MISSING_STATUSES:
+                        on_missing()
+                    if response.ok or (not search and not _is_not_found(response)):
+                        metrics.count("resolved_total", platform=platform, by="direct")
+                        return direct_result
+                    if not search:
+                        on_event("warning", "Direct URL failed. Falling back to web search...")
+                        metrics.count("search_fallbacks_total", platform=platform)
+                        search = pool.submit(_search_page, user_input, platform, lambda *event: search_events.append(event))
+                        pending.add(search)
+            if search in done:
+                for event in search_events:
+                    on_event(*event)
+                try:
+                    search_result = search.result()
+                except requests.RequestException as e:
+                    direct_error = direct_error or e
+                    continue
+                if search_result and search_result[0].ok:
+                    metrics.count("resolved_total", platform=platform, by="search")
+                    return search_result
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    # Neither reached a working page: report the search hit's page, else the guess's.
+    if search_result or direct_result:
+        return search_result or direct_result
+    raise direct_error
+
+
+def _fetch_profile(user_input, platform, save_folder, on_event, hedge_delay):
+    platform_config = PLATFORMS.get(platform)
+    if not platform_config:
+        on_event("error", f"Configuration for platform '{platform}' not found.")
+        _fail(platform, "unknown_platform")
+        return None
+
+    is_url = user_input.startswith("http")
+    if is_url:
+        url_platform = platform_for_url(user_input)
+        if url_platform and url_platform != platform:
+            on_event("debug", f"Skipping {user_input} on {platform}: it is a {url_platform} URL.")
+            return None
+
+    miss_cache = get_miss_cache()
+    miss_key = cache_key(user_input, platform)
+    known_miss = miss_cache.get(miss_key)
+    # A missing direct address only settles the lookup when there is no search to fall back on.
+    if known_miss in (SEARCH_FOUND_NOTHING, NO_IMAGE) or (known_miss == DIRECT_NOT_FOUND and is_url):
+        metrics.count("cache_hits_total", cache="miss")
+        on_event("warning", f"'{user_input}' recently came up empty on {platform} ({known_miss}); skipping it.")
+        _fail(platform, "known_miss")
+        return None
+
+    profile_url = None
+    searched = False
+    if is_url:
+        profile_url = user_input
+    elif ' ' in user_input or len(user_input) < 5 or known_miss == DIRECT_NOT_FOUND:
+        profile_url = find_profile_url(user_input, platform.capitalize(), on_event)
+        searched = True
+    else:
+        profile_url = platform_config["url_template"](user_input.lower())
+
+    if not profile_url:
+        on_event("error", f"Could not determine a URL for '{user_input}' on {platform}.")
+        _fail(platform, "no_profile_url")
+        return None
+
+    try:
+        on_event("info", f"Attempting to fetch page: {profile_url}")
+        if is_url or searched:
+            response, doc = _fetch_page(profile_url, platform)
+            if response.status_code in MISSING_STATUSES and is_url:
+                miss_cache.set(miss_key, DIRECT_NOT_FOUND)
+        else:
+            response, doc = _resolve_guess(
+                user_input, platform, profile_url, on_event, hedge_delay,
+                on_missing=lambda: miss_cache.set(miss_key, DIRECT_NOT_FOUND),
+            )
+        response.raise_for_status()
+
+        image_rules = platform_config["image_rules"]
+        with metrics.timed("extract", platform=platform):
+            found = collect_profile(doc, response.url, image_rules)
+        if not rank(found, [rule for rule in image_rules if rule != ICON_RULE]):
+            # Nothing but a favicon in <head>; the <img> rules need the whole page.
+            metrics.count("full_page_fetches_total", platform=platform)
+            with metrics.timed("full_page_fetch", platform=platform):
+                response = http_client.get(response.url, cache=True)
+            response.raise_for_status()
+            with metrics.timed("parse", platform=platform):
+                doc = parse_html(response.text)
+            with metrics.timed("extract", platform=platform):
+                found = collect_profile(doc, response.url, image_rules)
+        img_url = extract_image_url(found, response.url, image_rules)
+        display_name = extract_display_name(found)
+
+        if not img_url:
+            on_event("warning", f"Could not find an image URL on {response.url}")
+            miss_cache.set(miss_key, NO_IMAGE)
+            _fail(platform, "no_image")
+            return None
+
+        store = get_store(save_folder)
+        with metrics.timed("download", platform=platform):
+            download = http_client.download(img_url, store.incoming_dir, cache=True)
+
+        filename = profile_filename(user_input, platform)
+        with metrics.timed("store", platform=platform):
+            filepath = store.save_file(download["path"], filename, digest=download["digest"])
+            near_duplicate_of = store.near_duplicate_of(filepath)
+        if near_duplicate_of:
+            on_event("info", f"Image for '{user_input}' looks like {near_duplicate_of}.")
+
+        # Whatever an earlier or concurrent lookup recorded, this one did not come up empty.
+        miss_cache.delete(miss_key, values=(SEARCH_FOUND_NOTHING, NO_IMAGE))
+        on_event("success", f"Saved: {display_name or filename}")
+        return {
+            "query": user_input,
+            "platform": platform,
+            "profile_url": response.url,
+            "image_url": img_url,
+            "filepath": filepath,
+            "filename": filename,
+            "display_name": display_name or user_input,
+            "near_duplicate_of": near_duplicate_of,
+        }
+
+    except requests.RequestException as e:
+        on_event("error", f"Failed to process '{user_input}'. Reason: {e}")
+        _fail(platform, _failure_reason(e))
+        return None
+
+
+def _failure_reason(error):
+    """
+    A short label for a request failure: the status of an HTTP error response, else the
+    exception type. Other errors can carry a response too (a refused download has its 200).
+    """
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return f"http_{error.response.status_code}"
+    return type(error).__name__
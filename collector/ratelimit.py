@@ -0,0 +1,224 @@
+"""
+Per-host adaptive rate limiting with retries.
+
+Every host (and the DuckDuckGo search API, under ``DDGS_KEY``) gets a
+``HostLimiter``: a token bucket caps requests per second, and an in-flight cap
+limits concurrent requests. Both adapt AIMD-style. Each success nudges them back
+up towards their ceilings, and each 429/503 halves them and pauses the host for
+its Retry-After. Transient failures (connection errors, timeouts, 502/503/504,
+429) are retried with full-jitter exponential backoff, so a burst of throttling
+slows the batch down instead of failing every lookup in it.
+"""
+import email.utils
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+DDGS_KEY = "duckduckgo"
+
+DEFAULT_RATE = 5.0
+DEFAULT_BURST = 5
+DEFAULT_MAX_CONCURRENCY = 8
+# The slowest a throttled host is ever driven down to, in requests per second.
+MIN_RATE = 0.2
+# Requests per second regained per successful request.
+RATE_STEP = 0.1
+# Per-host overrides of the defaults above. DuckDuckGo throttles search far sooner than any site.
+HOST_LIMITS = {
+    DDGS_KEY: {"rate": 0.5, "burst": 2, "max_concurrency": 2},
+    "www.linkedin.com": {"rate": 0.5, "burst": 2, "max_concurrency": 2},
+    "medium.com": {"rate": 2.0, "burst": 4, "max_concurrency": 4},
+}
+
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+# A Retry-After longer than this is not waited out; the throttled response is returned instead.
+MAX_RETRY_AFTER = 60
+RETRY_STATUSES = {429, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+
+_lock = threading.Lock()
+_limiters = {}
+
+
+class HostLimiter:
+    """A token bucket plus an in-flight cap for one host, both adjusted AIMD-style."""
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max_concurrency)
+        self.tokens = float(burst)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Blocks until the host is not paused, a token is available and an in-flight slot is free."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.in_flight >= max(1, int(self.concurrency)):
+                        wait = None  # until a release() frees a slot
+                    elif self.tokens >= 1:
+                        self.tokens -= 1
+                        self.in_flight += 1
+                        self.requests += 1
+                        return
+                    else:
+                        wait = (1 - self.tokens) / self.rate
+                self._cond.wait(wait)
+
+    def release(self, throttled=False, retry_after=None, retrying=False):
+        """
+        Frees the slot taken by ``acquire``. A throttled request halves the rate and
+        concurrency and pauses the host for ``retry_after`` seconds; any other result
+        grows them back additively. ``retrying`` counts the request as retried.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            self.retries += retrying
+            if throttled:
+                self.throttled += 1
+                self.rate = max(MIN_RATE, self.rate / 2)
+                self.concurrency = max(1.0, self.concurrency / 2)
+                self.tokens = min(self.tokens, 0.0)
+                if retry_after:
+                    pause = time.monotonic() + min(retry_after, MAX_RETRY_AFTER)
+                    self.blocked_until = max(self.blocked_until, pause)
+            else:
+                self.rate = min(self.max_rate, self.rate + RATE_STEP)
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            self._cond.notify_all()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def stats(self):
+        return {
+            "rate": round(self.rate, 2),
+            "concurrency": int(self.concurrency),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "retries": self.retries,
+        }
+
+
+def get_limiter(key):
+    """Returns the limiter for a host name (or ``DDGS_KEY``), creating it on first use."""
+    with _lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = HostLimiter(**HOST_LIMITS.get(key, {}))
+    return limiter
+
+
+def backoff(attempt):
+    """Full-jitter exponential backoff: a random delay of up to ``BACKOFF_BASE * 2**attempt``."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def retry_after_seconds(response):
+    """The Retry-After header as seconds (it may be a delay or an HTTP date), or None."""
+    value = response.headers.get("Retry-After", "").strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def send(url, request, retries=MAX_RETRIES):
+    """
+    Calls ``request()`` (which returns a ``requests.Response`` for ``url``) under the
+    host's limiter, retrying connection errors, timeouts and ``RETRY_STATUSES``. The
+    last response is returned as-is once retries run out, for the caller to handle.
+    """
+    limiter = get_limiter(urlparse(url).netloc.lower())
+    for attempt in range(retries + 1):
+        limiter.acquire()
+        try:
+            response = request()
+        except (requests.ConnectionError, requests.Timeout):
+            limiter.release(retrying=attempt < retries)
+            if attempt == retries:
+                raise
+            time.sleep(backoff(attempt))
+            continue
+        except BaseException:
+            # Anything else is not retried, but the slot must still be given back.
+            limiter.release()
+            raise
+
+        throttled = response.status_code in THROTTLE_STATUSES
+        retry_after = retry_after_seconds(response) if throttled else None
+        retrying = (
+            response.status_code in RETRY_STATUSES
+            and attempt < retries
+            and not (retry_after and retry_after > MAX_RETRY_AFTER)
+        )
+        limiter.release(throttled=throttled, retry_after=retry_after, retrying=retrying)
+        if not retrying:
+            return response
+        response.close()
+        # The limiter already pauses the host for Retry-After; the jitter spreads the retries out.
+        time.sleep(backoff(attempt))
+
+
+def call(key, fn, retry_on=(), throttle_on=(), retries=MAX_RETRIES):
+    """
+    Runs ``fn()`` under the limiter for ``key``. Exceptions in ``throttle_on`` back the
+    limiter off; those and ``retry_on`` ones are retried with jittered backoff.
+    """
+    limiter = get_limiter(key)
+    for attempt in range(retries + 1):
+        limiter.acquire()
+        try:
+            result = fn()
+        except throttle_on:
+            limiter.release(throttled=True, retry_after=backoff(attempt + 1), retrying=attempt < retries)
+            if attempt == retries:
+                raise
+        except retry_on:
+            limiter.release(retrying=attempt < retries)
+            if attempt == retries:
+                raise
+        except BaseException:
+            limiter.release()
+            raise
+        else:
+            limiter.release()
+            return result
+        time.sleep(backoff(attempt))
+
+
+def ddgs_call(fn, retries=MAX_RETRIES):
+    """``call`` under the DuckDuckGo search budget; its rate-limit errors back the budget off."""
+    from duckduckgo_search.exceptions import RatelimitException, TimeoutException
+
+    return call(DDGS_KEY, fn, retry_on=(TimeoutException,), throttle_on=(RatelimitException,), retries=retries)
+
+
+def stats():
+    """Current rate, concurrency and counters of every limiter, by host."""
+    with _lock:
+        limiters = dict(_limiters)
+    return {key: limiter.stats() for key, limiter in sorted(limiters.items())}
@@ -0,0 +1,24 @@
+"""Shared, persistent cache of name -> profile URL resolutions from web search."""
+import threading
+
+from collector.ttl_cache import TTLCache
+
+SEARCH_TTL = 7 * 24 * 60 * 60
+SEARCH_MAX_ENTRIES = 50000
+
+_lock = threading.Lock()
+_cache = None
+
+
+def get_search_cache():
+    """Returns the process-wide search cache, opening it on first use."""
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = TTLCache("profile_search", ttl=SEARCH_TTL, max_entries=SEARCH_MAX_ENTRIES)
+    return _cache
+
+
+def cache_key(query, platform_name):
+    """Normalizes case and whitespace so trivially different spellings share an entry."""
+    return f"{platform_name.lower()}:{' '.join(query.lower().split())}"
@@ -0,0 +1,57 @@
+"""
+Fixed-size gallery thumbnails, cached on disk by image content hash.
+
+Galleries rerender on every Streamlit interaction, and sending full-size
+og:image banners to the browser each time is slow. Thumbnails are made once,
+off the request path, on a small worker pool when an image is saved (Pillow
+releases the GIL while decoding and resizing). A thumbnail that is not ready
+yet is made on first display.
+"""
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, UnidentifiedImageError
+
+from collector import CACHE_ROOT
+
+THUMB_DIR = os.path.join(CACHE_ROOT, "thumbs")
+THUMB_SIZE = 384
+THUMB_QUALITY = 85
+THUMB_WORKERS = 4
+
+_pool = ThreadPoolExecutor(max_workers=THUMB_WORKERS, thread_name_prefix="thumbnails")
+
+
+def thumbnail_path(digest, size=THUMB_SIZE):
+    return os.path.join(THUMB_DIR, digest[:2], f"{digest}_{size}.jpg")
+
+
+def make_thumbnail(source, digest, size=THUMB_SIZE):
+    """
+    Returns the path of the ``size`` px thumbnail for ``source``, creating it if needed.
+    Falls back to ``source`` itself for files Pillow cannot or will not read (e.g. SVG
+    favicons, or decompression bombs over Pillow's pixel limit).
+    """
+    path = thumbnail_path(digest, size)
+    if os.path.exists(path):
+        return path
+    try:
+        with Image.open(source) as image:
+            image.draft("RGB", (size, size))
+            image.thumbnail((size, size))
+            # copy() forces the decode; an image already under ``size`` is still unloaded here.
+            thumb = image.copy() if image.mode == "RGB" else image.convert("RGB")
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        return source
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    with os.fdopen(fd, "wb") as f:
+        thumb.save(f, "JPEG", quality=THUMB_QUALITY)
+    os.replace(tmp_path, path)
+    return path
+
+
+def schedule(source, digest, size=THUMB_SIZE):
+    """Queues ``make_thumbnail`` on the worker pool and returns immediately."""
+    _pool.submit(make_thumbnail, source, digest, size)
@@ -0,0 +1,118 @@
+"""
+Small SQLite-backed key/value cache with a TTL, a max-entries bound and
+hit/miss counters.
+
+The database is opened in WAL mode, so several Streamlit sessions, CLI runs and
+worker processes can share one file and its results survive restarts. Each
+cache lives in its own ``namespace`` inside the shared file.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from collector import CACHE_ROOT
+
+DB_PATH = os.path.join(CACHE_ROOT, "lookups.sqlite")
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS entries (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        stored_at REAL NOT NULL,
+        last_used REAL NOT NULL,
+        PRIMARY KEY (namespace, key)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS entries_lru ON entries (namespace, last_used)",
+    """
+    CREATE TABLE IF NOT EXISTS counters (
+        namespace TEXT PRIMARY KEY,
+        hits INTEGER NOT NULL DEFAULT 0,
+        misses INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+]
+
+
+class TTLCache:
+    """A persistent JSON value cache; entries expire after ``ttl`` seconds."""
+
+    def __init__(self, namespace, ttl, max_entries=10000, path=DB_PATH):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                self._db.execute(statement)
+            self._db.execute("INSERT OR IGNORE INTO counters (namespace) VALUES (?)", (namespace,))
+
+    def get(self, key):
+        """Returns the cached value for ``key``, or None if it is missing or expired."""
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT value FROM entries WHERE namespace = ? AND key = ? AND stored_at > ?",
+                (self.namespace, key, now - self.ttl),
+            ).fetchone()
+            if row:
+                self._db.execute(
+                    "UPDATE entries SET last_used = ? WHERE namespace = ? AND key = ?",
+                    (now, self.namespace, key),
+                )
+            counter = "hits" if row else "misses"
+            self._db.execute(
+                f"UPDATE counters SET {counter} = {counter} + 1 WHERE namespace = ?", (self.namespace,)
+            )
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        """Stores ``value``, then drops expired entries and trims to ``max_entries``."""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), now, now),
+            )
+            self._db.execute(
+                "DELETE FROM entries WHERE namespace = ? AND stored_at <= ?", (self.namespace, now - self.ttl)
+            )
+            self._db.execute(
+                """
+                DELETE FROM entries WHERE namespace = ? AND key IN (
+                    SELECT key FROM entries WHERE namespace = ?
+                    ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.namespace, self.namespace, self.max_entries),
+            )
+
+    def delete(self, key, values=None):
+        """Removes ``key``; with ``values``, only if it holds one of them."""
+        with self._lock, self._db:
+            if values is None:
+                self._db.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+            else:
+                self._db.executemany(
+                    "DELETE FROM entries WHERE namespace = ? AND key = ? AND value = ?",
+                    [(self.namespace, key, json.dumps(value)) for value in values],
+                )
+
+    def stats(self):
+        """Hit/miss counters (shared by every process using the file) and the live entry count."""
+        with self._lock:
+            hits, misses = self._db.execute(
+                "SELECT hits, misses FROM counters WHERE namespace = ?", (self.namespace,)
+            ).fetchone()
+            entries = self._db.execute(
+                "SELECT COUNT(*) FROM entries WHERE namespace = ? AND stored_at > ?",
+                (self.namespace, time.time() - self.ttl),
+            ).fetchone()[0]
+        return {"hits": hits, "misses": misses, "entries": entries}
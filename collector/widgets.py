@@ -0,0 +1,57 @@
+"""
+Streamlit controls shared by the apps: sidebar settings, gallery images and
+ZIP downloads.
+
+Like ``collector.metrics_panel``, this module imports Streamlit, so only the
+apps import it.
+"""
+import streamlit as st
+
+from collector import export, normalize
+from collector.image_store import get_store
+
+
+def normalize_settings():
+    """
+    The "Normalize images" sidebar toggle and its settings. Returns the keyword
+    arguments for ``normalize.normalize_images``, or None while it is off.
+    """
+    if not st.sidebar.toggle("🗜️ Normalize images"):
+        return None
+    with st.sidebar.expander("🗜️ Normalization", expanded=True):
+        return {
+            "max_edge": st.slider("Max edge (px)", 128, 4096, normalize.MAX_EDGE, step=64),
+            "target_format": st.selectbox("Format", normalize.TARGET_FORMATS),
+            "quality": st.slider("Quality", 30, 100, normalize.QUALITY),
+        }
+
+
+def gallery_toggle(folder):
+    """
+    The "Show full-size originals" sidebar toggle. Returns ``gallery_image(path)``, which
+    gives ``st.image`` the cached thumbnail of a saved image in ``folder``, or the image
+    itself while the toggle is on, so full-size originals are only sent when asked for.
+    """
+    show_originals = st.sidebar.toggle("🖼️ Show full-size originals")
+    store = get_store(folder)
+
+    def gallery_image(path):
+        return path if show_originals else store.thumbnail(path)
+
+    return gallery_image
+
+
+def zip_download_button(label, filepaths, folder, file_name):
+    """
+    A download button for a ZIP of ``filepaths`` saved in ``folder``. The archive is only
+    built (or taken from the export cache, see ``export.zip_images``) and opened when the
+    button is clicked; the same image under two names is zipped once.
+    """
+    filepaths = list(filepaths)
+    digest_for = get_store(folder).digest_for
+    return st.download_button(
+        label,
+        data=lambda: open(export.zip_images(filepaths, digest_for=digest_for), "rb"),
+        file_name=file_name,
+        mime="application/zip",
+    )
@@ -1,157 +1,86 @@
 import streamlit as st
 import os
-import requests
-from urllib.parse import urljoin, urlparse
-from bs4 import BeautifulSoup
-import json
-from duckduckgo_search import DDGS
+import sys
+import threading
+import uuid
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# Make the shared `collector` package importable when launched via `streamlit run`.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from collector import http_client, jobs, metrics_panel, normalize, profiles, ratelimit, widgets
+from collector.engine import DEFAULT_CONCURRENCY
+from collector.miss_cache import get_miss_cache
+from collector.search_cache import get_search_cache
 
 # --- Constants and Setup ---
 SAVE_FOLDER = "images"
 os.makedirs(SAVE_FOLDER, exist_ok=True)
 
-if "scraped_profiles" not in st.session_state:
-    st.session_state.scraped_profiles = []
-
 # --- Core Functions ---
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-}
-PLATFORMS = {
-    "substack": {"url_template": lambda user: f"https://{user}.substack.com"},
-    "medium": {"url_template": lambda user: f"https://medium.com/@{user.strip('@')}"}
-}
-
-def find_profile_url_with_search(query, platform_name):
-    """Uses DuckDuckGo to find a profile URL by trying multiple search patterns."""
-    st.info(f"Searching the web for '{query}' on {platform_name}...")
-    site_domain = f"{platform_name.lower()}.com"
-    search_queries = [
-        f'"{query}" site:{site_domain}',
-        f'"{query}" {platform_name} author profile'
-    ]
-    try:
-        with DDGS() as ddgs:
-            for i, search_query in enumerate(search_queries):
-                st.write(f"Attempting search ({i+1}/2): `{search_query}`")
-                results = list(ddgs.text(search_query, max_results=3))
-                for result in results:
-                    url = result.get('href')
-                    if url and site_domain in urlparse(url).netloc:
-                        path = urlparse(url).path
-                        if len(path) > 1 and not any(page in path.lower() for page in ['/about', '/topics', '/search', '/tag']):
-                            st.success(f"Found potential profile: {url}")
-                            return url
-    except Exception as e:
-        st.warning(f"Web search encountered an error: {e}")
-    st.warning(f"Could not find a likely profile for '{query}' in search results.")
-    return None
-
-def _extract_image_from_html(soup, base_url):
-    """
-    Finds the profile image by prioritizing specific classes before falling back to meta tags.
-    """
-    profile_img = soup.find("img", class_=lambda c: c and any(key in c for key in ["avatar", "profile", "author"]))
-    if profile_img and profile_img.get("src"):
-        return urljoin(base_url, profile_img["src"])
-    og_image = soup.find("meta", property="og:image")
-    if og_image and og_image.get("content"):
-        return urljoin(base_url, og_image["content"])
-    twitter_image = soup.find("meta", property="twitter:image")
-    if twitter_image and twitter_image.get("content"):
-        return urljoin(base_url, twitter_image["content"])
-    icon_link = soup.find("link", rel="icon")
-    if icon_link and icon_link.get("href"):
-        return urljoin(base_url, icon_link["href"])
-    return None
-
-def _extract_display_name(soup):
-    """Finds the display name using a priority list of common locations."""
-    json_ld_script = soup.find("script", type="application/ld+json")
-    if json_ld_script:
-        try:
-            data = json.loads(json_ld_script.string)
-            if data.get("@type") == "ProfilePage" and data.get("mainEntity"):
-                return data["mainEntity"].get("name", "").strip()
-            if data.get("author") and data["author"].get("name"):
-                return data["author"]["name"].strip()
-        except (json.JSONDecodeError, AttributeError):
-            pass
-    og_title = soup.find("meta", property="og:title")
-    if og_title and og_title.get("content"):
-        name = og_title["content"]
-        og_site_name = soup.find("meta", property="og:site_name")
-        if og_site_name and og_site_name.get("content"):
-            name = name.replace(f"| {og_site_name['content']}", "")
-            name = name.replace(f"- {og_site_name['content']}", "")
-        return name.strip()
-    h1_tag = soup.find("h1")
-    if h1_tag and h1_tag.string:
-        return h1_tag.string.strip()
-    if soup.title and soup.title.string:
-        return soup.title.string.split('|')[0].strip()
-    return None
+def show_event(level, message):
+    """Shows a lookup event from ``collector.profiles`` in the page."""
+    if level == "debug":
+        st.write(message)
+    else:
+        getattr(st, level)(message)
 
 def fetch_profile_image(user_input, platform):
     """Fetches a profile image, using a direct guess first, then falling back to a web search."""
-    profile_url = None
-    if user_input.startswith("http"):
-        profile_url = user_input
-    elif ' ' in user_input or len(user_input) < 5:
-        profile_url = find_profile_url_with_search(user_input, platform.capitalize())
-    else:
-        platform_config = PLATFORMS.get(platform)
-        if platform_config:
-            profile_url = platform_config["url_template"](user_input.lower())
-
-    if not profile_url:
-        st.error(f"Could not determine a URL for '{user_input}' on {platform}.")
-        return None
-
-    try:
-        st.info(f"Attempting to fetch page: {profile_url}")
-        response = requests.get(profile_url, timeout=10, allow_redirects=True, headers=HEADERS)
-        if response.status_code != 200 and not user_input.startswith("http"):
-            st.warning("Direct URL failed. Falling back to web search...")
-            search_url = find_profile_url_with_search(user_input, platform.capitalize())
-            if search_url:
-                response = requests.get(search_url, timeout=10, allow_redirects=True, headers=HEADERS)
-        response.raise_for_status()
-
-        soup = BeautifulSoup(response.text, "html.parser")
-        img_url = _extract_image_from_html(soup, response.url)
-        display_name = _extract_display_name(soup)
-        
-        if not img_url:
-            st.warning(f"Could not find an image URL on {response.url}")
-            return None
-            
-        img_response = requests.get(img_url, timeout=10, headers=HEADERS)
-        img_response.raise_for_status()
-        
-        username = user_input.lower().split('.')[0].strip('@').replace(' ', '_')
-        filename = f"{platform}_{username}.jpg"
-        filepath = os.path.join(SAVE_FOLDER, filename)
-        
-        with open(filepath, "wb") as f:
-            f.write(img_response.content)
-            
-        st.success(f"Saved: {display_name or filename}")
-        
-        return {
-            "filepath": filepath,
-            "display_name": display_name or user_input
-        }
-        
-    except requests.RequestException as e:
-        st.error(f"Failed to process '{user_input}'. Reason: {e}")
-        return None
+    return profiles.fetch_profile(user_input, platform, SAVE_FOLDER, on_event=show_event)
+
+@st.cache_resource(show_spinner=False)
+def get_job_queue():
+    return jobs.JobQueue()
+
+def fetch_and_normalize(user_input, platform, reports):
+    """``fetch_profile_image``, with the saved image normalized when that is turned on."""
+    result = fetch_profile_image(user_input, platform)
+    if result and normalize_settings:
+        report = next(normalize.normalize_images([result["filepath"]], SAVE_FOLDER, **normalize_settings))
+        reports.append(report)
+        result["filepath"] = report["filepath"]
+        result["filename"] = os.path.basename(report["filepath"])
+    return result
+
+def run_batch(batch_id, concurrency):
+    """Works the batch in the job queue, with a progress bar read from the queue itself."""
+    job_queue = get_job_queue()
+    normalize_reports = []
+    counts = job_queue.progress(batch_id)
+    progress = st.progress(0.0, text=f"Checking {counts['total']} profile(s)...")
+    # Worker threads need the script context to call st.* from fetch_profile_image.
+    ctx = get_script_run_ctx()
+    results = jobs.work(
+        job_queue,
+        lambda user_input, platform: fetch_and_normalize(user_input, platform, normalize_reports),
+        batch_id=batch_id,
+        concurrency=concurrency,
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx),
+    )
+    for task, _ in results:
+        counts = job_queue.progress(batch_id)
+        checked = counts["done"] + counts["failed"]
+        progress.progress(
+            checked / counts["total"],
+            text=f"Checked **{task['query']}** on {task['platform']} ({checked}/{counts['total']})",
+        )
+        refresh_metrics()
+    if normalize_reports:
+        st.caption(f"🗜️ {normalize.describe(normalize.summarize(normalize_reports))}")
 
 # --- Streamlit User Interface ---
 st.set_page_config(page_title="Profile Image Finder", layout="wide")
 st.title("Profile Image Finder 🕵️‍♂️")
 st.markdown("Enter names, usernames, or full profile URLs. The app will search for them on the selected platforms.")
 
+gallery_image = widgets.gallery_toggle(SAVE_FOLDER)
+
+# Live stage timings and counters of this server process, redrawn while lookups run.
+refresh_metrics = metrics_panel.sidebar()
+
+# Saved images are re-encoded to one real format and size after each lookup, on a process pool.
+normalize_settings = widgets.normalize_settings()
+
 user_inputs = st.text_area(
     "Enter Names or URLs (one per line)",
     height=150,
@@ -163,28 +92,54 @@ selected_platforms_display = st.multiselect(
     default=['Substack', 'Medium']
 )
 selected_platforms = [p.lower() for p in selected_platforms_display]
+concurrency = st.slider("Concurrent lookups:", 1, 32, DEFAULT_CONCURRENCY)
+
+# The current batch lives in the job queue and is named in the URL, so a reloaded
+# or crashed session picks it up again instead of losing its progress.
+job_queue = get_job_queue()
+batch_name = st.query_params.get("batch")
+batch_id = job_queue.batch_id(batch_name) if batch_name else None
 
 if st.button("🚀 Fetch Profile Images", type="primary"):
-    st.session_state.scraped_profiles.clear()
-    queries = [line.strip() for line in user_inputs.strip().splitlines() if line.strip()]
+    # Drop repeated lines so two workers never write the same file at once.
+    queries = list(dict.fromkeys(line.strip() for line in user_inputs.strip().splitlines() if line.strip()))
     if not queries:
         st.warning("Please enter at least one name or URL.")
     elif not selected_platforms:
         st.warning("Please select at least one platform.")
     else:
-        for query in queries:
-            st.markdown(f"--- \n### Searching for: **{query}**")
-            for platform in selected_platforms:
-                with st.spinner(f"Checking {platform}..."):
-                    profile_data = fetch_profile_image(query, platform)
-                    if profile_data and profile_data not in st.session_state.scraped_profiles:
-                        st.session_state.scraped_profiles.append(profile_data)
+        batch_name = uuid.uuid4().hex[:12]
+        st.query_params["batch"] = batch_name
+        batch_id = job_queue.add_batch(batch_name, queries, selected_platforms)
+        run_batch(batch_id, concurrency)
+elif batch_id:
+    counts = job_queue.progress(batch_id)
+    remaining = counts["pending"] + counts["running"]
+    if remaining:
+        st.info(f"Batch `{batch_name}`: {counts['done'] + counts['failed']} of {counts['total']} lookup(s) finished.")
+        if st.button(f"▶️ Resume ({remaining} left)"):
+            run_batch(batch_id, concurrency)
+
+with st.sidebar.expander("🔌 Connection reuse"):
+    st.json(http_client.connection_stats())
+with st.sidebar.expander("🔎 Search cache"):
+    st.json(get_search_cache().stats())
+with st.sidebar.expander("🚫 Known misses"):
+    st.json(get_miss_cache().stats())
+with st.sidebar.expander("🚦 Rate limits"):
+    st.json(ratelimit.stats())
+refresh_metrics(force=True)
 
 # --- Image Display Section ---
-if st.session_state.scraped_profiles:
+scraped_profiles = []
+if batch_id:
+    for task in job_queue.results(batch_id):
+        if task["result"] and task["result"] not in scraped_profiles:
+            scraped_profiles.append(task["result"])
+if scraped_profiles:
     st.markdown("--- \n## Fetched Images 🖼️")
     cols = st.columns(4)
-    for idx, profile in enumerate(st.session_state.scraped_profiles):
+    for idx, profile in enumerate(scraped_profiles):
         with cols[idx % 4]:
-            st.image(profile["filepath"], caption=profile["display_name"], use_container_width=True)
+            st.image(gallery_image(profile["filepath"]), caption=profile["display_name"], use_container_width=True)
 
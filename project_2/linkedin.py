@@ -1,217 +1,158 @@
 import os
-import time
-import io
+import sys
+from urllib.parse import urlparse
 import requests
 import streamlit as st
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from zipfile import ZipFile
-from duckduckgo_search import DDGS
+from selenium.common.exceptions import WebDriverException
+
+# Make the shared `collector` package importable when launched via `streamlit run`.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from collector import http_client, image_search, metrics, metrics_panel, normalize, ratelimit, widgets
+from collector.fetchers import fetch_medium_profile_image, fetch_substack_profile_image
+from collector.image_store import get_store
+from collector.browser_pool import PROFILE_IMAGE_CLASSES, DriverPool
+from collector.extract import parse_html, rank
+from collector.engine import DEFAULT_CONCURRENCY, fetch_matrix
 
 # Load li_at cookie from .env
 load_dotenv()
 LI_AT_COOKIE = os.getenv("LI_AT")
 SAVE_FOLDER = "images"
 os.makedirs(SAVE_FOLDER, exist_ok=True)
+# Warm Chrome drivers kept for the whole server process; each is recycled after this many pages.
+BROWSER_POOL_SIZE = 2
+BROWSER_MAX_PAGES = 50
+# The profile photo is the first <img> with one of these classes (see collector.extract for rule kinds).
+IMAGE_RULES = [("img_class", tuple(PROFILE_IMAGE_CLASSES))]
+# Profiles are first fetched over plain HTTP with the li_at cookie. The browser is only
+# started when LinkedIn challenges that request (these statuses, or a redirect to one of
+# these paths) or serves a page whose photo is rendered client-side.
+CHALLENGE_STATUSES = {401, 403, 999}
+CHALLENGE_PATHS = ("/authwall", "/checkpoint", "/login", "/uas/login")
+ESCALATE_OUTCOMES = {"challenged", "client_rendered"}
+PAGE_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
+
+def linkedin_cookies():
+    """The li_at cookie scoped to LinkedIn: kept across its redirects, never sent to other hosts."""
+    jar = requests.cookies.RequestsCookieJar()
+    jar.set("li_at", LI_AT_COOKIE, domain=".linkedin.com", path="/")
+    return jar
+
+@st.cache_resource(show_spinner=False)
+def get_driver_pool():
+    return DriverPool(LI_AT_COOKIE, size=BROWSER_POOL_SIZE, max_pages=BROWSER_MAX_PAGES)
+
+def _find_image_url(profile_url):
+    """The profile photo URL from the cheapest tier that finds it: plain HTTP, then the browser."""
+    img_url, outcome = _http_tier(profile_url)
+    metrics.count("tier_results_total", platform="linkedin", tier="http", outcome=outcome)
+    if img_url or outcome not in ESCALATE_OUTCOMES:
+        return img_url
+    try:
+        img_url = _browser_tier(profile_url)
+    except WebDriverException:
+        metrics.count("tier_results_total", platform="linkedin", tier="browser", outcome="error")
+        raise
+    metrics.count("tier_results_total", platform="linkedin", tier="browser", outcome="found" if img_url else "no_image")
+    return img_url
+
+def _http_tier(profile_url):
+    """Looks for the photo in the server-rendered profile page; returns (image URL or None, outcome)."""
+    headers = {"User-Agent": PAGE_USER_AGENT}
+    try:
+        with metrics.timed("page_fetch", platform="linkedin"):
+            response = http_client.get(profile_url, headers=headers, cookies=linkedin_cookies())
+    except requests.RequestException:
+        return None, "error"
+    if response.status_code in CHALLENGE_STATUSES or urlparse(response.url).path.startswith(CHALLENGE_PATHS):
+        return None, "challenged"
+    if response.status_code != 200:
+        return None, f"http_{response.status_code}"
+    with metrics.timed("parse", platform="linkedin"):
+        found = parse_html(response.text).collect(IMAGE_RULES)
+    img_url = rank(found, IMAGE_RULES)
+    return img_url, "found" if img_url else "client_rendered"
+
+def _browser_tier(profile_url):
+    """Renders the profile in a pooled browser and looks for the photo there."""
+    # The browser is paced by the same per-host limiter as plain HTTP requests.
+    with metrics.timed("browser_page", platform="linkedin"):
+        page_source = ratelimit.call("www.linkedin.com", lambda: get_driver_pool().page_source(profile_url))
+    with metrics.timed("parse", platform="linkedin"):
+        found = parse_html(page_source).collect(IMAGE_RULES)
+    return rank(found, IMAGE_RULES)
+
+def tier_stats():
+    """Attempts and success rate of each fetch tier in this server process."""
+    stats = {}
+    for counter in metrics.snapshot()["counters"]:
+        if counter["name"] == "tier_results_total" and counter.get("platform") == "linkedin":
+            tier = stats.setdefault(counter["tier"], {"attempts": 0, "found": 0})
+            tier["attempts"] += counter["value"]
+            if counter["outcome"] == "found":
+                tier["found"] += counter["value"]
+    for tier in stats.values():
+        tier["success_rate"] = round(tier["found"] / tier["attempts"], 3)
+    return stats
 
 def fetch_profile_image(profile_url):
-    chrome_options = Options()
-    chrome_options.add_argument("--headless=new")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--no-sandbox")
+    with metrics.timed("lookup", platform="linkedin"):
+        filename, filepath = _fetch_profile_image(profile_url)
+    metrics.count("lookups_total", platform="linkedin", outcome="saved" if filepath else "not_saved")
+    return filename, filepath
 
-    driver = webdriver.Chrome(service=Service(), options=chrome_options)
+def _fetch_profile_image(profile_url):
     try:
-        driver.get("https://www.linkedin.com")
-        time.sleep(1)
-        driver.add_cookie({"name": "li_at", "value": LI_AT_COOKIE, "domain": ".linkedin.com"})
-        driver.get(profile_url)
-        time.sleep(5)
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-    finally:
-        driver.quit()
-
-    # Find image tag
-    img_tag = soup.find("img", {
-        "class": lambda x: x and (
-            "profile-photo-edit__preview" in x or 
-            "pv-top-card-profile-picture__image" in x or 
-            "ivm-view-attr__img--centered" in x or 
-            "artdeco-entity-image" in x
-        )
-    })
-
-    if not img_tag or not img_tag.get("src"):
-        return None, None
-
-    img_url = img_tag.get("src")
-    headers = {
-        "User-Agent": "Mozilla/5.0",
-        "Cookie": f"li_at={LI_AT_COOKIE}"
-    }
-
-    response = requests.get(img_url, headers=headers)
-    if response.status_code == 200:
-        username = profile_url.strip('/').split('/')[-1]
-        filename = f"{username}.jpg"
-        filepath = os.path.join(SAVE_FOLDER, filename)
-        with open(filepath, "wb") as f:
-            f.write(response.content)
-        return filename, filepath
-    else:
+        img_url = _find_image_url(profile_url)
+    except WebDriverException as e:
+        # Chrome failed to start or crashed on this page; fail this URL, not the batch.
+        metrics.count("failures_total", platform="linkedin", reason=type(e).__name__)
         return None, None
-
-def zip_images(filepaths):
-    zip_buffer = io.BytesIO()
-    with ZipFile(zip_buffer, "w") as zip_file:
-        for path in filepaths:
-            zip_file.write(path, arcname=os.path.basename(path))
-    zip_buffer.seek(0)
-    return zip_buffer
-
-def fetch_substack_profile_image(profile_url):
-    """
-    Fetches the profile image from a Substack profile URL or username.
-    Returns (filename, filepath) or (None, None) on failure.
-    """
-    try:
-        # Normalize input: allow username or full URL
-        if not profile_url.startswith("http"):
-            profile_url = f"https://{profile_url}.substack.com/"
-        if not profile_url.endswith("/"):
-            profile_url += "/"
-        response = requests.get(profile_url, timeout=10)
-        if response.status_code != 200:
-            return None, None
-        soup = BeautifulSoup(response.text, "html.parser")
-        img_url = None
-
-        # Try <img class="profile-image">
-        img_tag = soup.find("img", class_="profile-image")
-        if img_tag and img_tag.get("src"):
-            img_url = img_tag["src"]
-
-        # Try Open Graph image
-        if not img_url:
-            og_img = soup.find("meta", property="og:image")
-            if og_img and og_img.get("content"):
-                img_url = og_img["content"]
-
-        # Try favicon as fallback (sometimes used as profile image)
-        if not img_url:
-            icon_link = soup.find("link", rel="icon")
-            if icon_link and icon_link.get("href"):
-                img_url = icon_link["href"]
-                # Make absolute if needed
-                if img_url.startswith("/"):
-                    img_url = profile_url.rstrip("/") + img_url
-
-        # Try any <img> with likely profile image in src
-        if not img_url:
-            img_tag = soup.find("img", src=lambda x: x and ("profile" in x or "avatar" in x))
-            if img_tag and img_tag.get("src"):
-                img_url = img_tag["src"]
-
-        if not img_url:
-            return None, None
-
-        # Download image
-        img_response = requests.get(img_url, timeout=10)
-        if img_response.status_code == 200:
-            username = profile_url.split("//")[-1].split(".")[0]
-            filename = f"substack_{username}.jpg"
-            filepath = os.path.join(SAVE_FOLDER, filename)
-            with open(filepath, "wb") as f:
-                f.write(img_response.content)
-            return filename, filepath
-        else:
-            return None, None
-    except Exception as e:
+    if not img_url:
+        metrics.count("failures_total", platform="linkedin", reason="no_image")
         return None, None
+    headers = {"User-Agent": "Mozilla/5.0"}
 
-def fetch_medium_profile_image(profile_url):
-    """
-    Fetches the profile image from a Medium profile URL or username.
-    Returns (filename, filepath) or (None, None) on failure.
-    """
+    store = get_store(SAVE_FOLDER)
     try:
-        # Normalize URL
-        if not profile_url.startswith("http"):
-            profile_url = f"https://medium.com/@{profile_url.strip('@')}"
-        if not profile_url.endswith("/"):
-            profile_url += "/"
-        response = requests.get(profile_url, timeout=10, allow_redirects=True)
-        if response.status_code != 200:
-            return None, None
-        soup = BeautifulSoup(response.text, "html.parser")
-        img_url = None
-
-        # Try avatar-image class
-        img_tag = soup.find("img", class_="avatar-image")
-        if img_tag and img_tag.get("src"):
-            img_url = img_tag["src"]
-
-        # Try Open Graph image
-        if not img_url:
-            og_img = soup.find("meta", property="og:image")
-            if og_img and og_img.get("content"):
-                img_url = og_img["content"]
-
-        # Try any image with medium.com/v2/resize: in src
-        if not img_url:
-            img_tag = soup.find("img", src=lambda x: x and "medium.com/v2/resize:" in x)
-            if img_tag and img_tag.get("src"):
-                img_url = img_tag["src"]
-
-        # Fallback: any image with alt containing username
-        if not img_url:
-            username = profile_url.strip('/').split('/')[-1].strip('@')
-            img_tag = soup.find("img", alt=lambda x: x and username.lower() in x.lower())
-            if img_tag and img_tag.get("src"):
-                img_url = img_tag["src"]
-
-        if not img_url:
-            return None, None
-
-        # Download image
-        img_response = requests.get(img_url, timeout=10)
-        if img_response.status_code == 200:
-            username = profile_url.strip('/').split('/')[-1].strip('@')
-            filename = f"medium_{username}.jpg"
-            filepath = os.path.join(SAVE_FOLDER, filename)
-            with open(filepath, "wb") as f:
-                f.write(img_response.content)
-            return filename, filepath
-        else:
-            return None, None
-    except Exception as e:
+        with metrics.timed("download", platform="linkedin"):
+            download = http_client.download(img_url, store.incoming_dir, headers=headers, cookies=linkedin_cookies())
+    except requests.RequestException as e:
+        metrics.count("failures_total", platform="linkedin", reason=type(e).__name__)
         return None, None
-
-def fetch_duckduckgo_images(query, max_results=5):
-    images = []
-    user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.6367.207 Brave/124.0.6367.207 Safari/537.36"
-    try:
-        with DDGS() as ddgs:  # <-- removed user_agent argument
-            for r in ddgs.images(query, max_results=max_results):
-                img_url = r["image"]
-                img_response = requests.get(img_url, timeout=10, headers={"User-Agent": user_agent})
-                if img_response.status_code == 200:
-                    filename = os.path.basename(img_url.split("?")[0])
-                    filepath = os.path.join(SAVE_FOLDER, f"duckduckgo_{filename}")
-                    with open(filepath, "wb") as f:
-                        f.write(img_response.content)
-                    images.append((filename, filepath))
-    except Exception as e:
-        print(f"DuckDuckGo error: {e}")
-    return images
+    username = profile_url.strip('/').split('/')[-1]
+    filename = f"{username}.jpg"
+    with metrics.timed("store", platform="linkedin"):
+        filepath = store.save_file(download["path"], filename, digest=download["digest"])
+    return filename, filepath
 
 # ==== LinkedIn UI ====
 st.set_page_config(page_title="LinkedIn Profile Image Fetcher", layout="centered")
 st.title("🔗 LinkedIn Profile Image Fetcher")
 
+# Rendered into the sidebar slots now, filled in once every section below has run.
+connection_stats_slot = st.sidebar.expander("🔌 Connection reuse").empty()
+rate_limit_slot = st.sidebar.expander("🚦 Rate limits").empty()
+tier_stats_slot = st.sidebar.expander("🪜 LinkedIn fetch tiers").empty()
+
+gallery_image = widgets.gallery_toggle(SAVE_FOLDER)
+
+# Live stage timings and counters of this server process, redrawn while lookups run.
+refresh_metrics = metrics_panel.sidebar()
+
+# Saved images are re-encoded to one real format and size after each batch, on a process pool.
+normalize_settings = widgets.normalize_settings()
+
+def normalize_batch(filepaths):
+    """Normalizes a finished batch's images when that is turned on; returns their paths in the same order."""
+    if not normalize_settings or not filepaths:
+        return filepaths
+    reports = list(normalize.normalize_images(filepaths, SAVE_FOLDER, **normalize_settings))
+    renamed = {report["source"]: report["filepath"] for report in reports}
+    st.caption(f"🗜️ {normalize.describe(normalize.summarize(reports))}")
+    return [renamed.get(path, path) for path in filepaths]
+
 st.markdown("Paste **one or more LinkedIn profile URLs** below:")
 
 input_urls = st.text_area("LinkedIn Profile URLs (one per line)", height=200)
@@ -229,27 +170,29 @@ if start:
         st.warning("Please enter at least one LinkedIn profile URL.")
     else:
         filepaths = []
-        for url in urls:
-            with st.spinner(f"Fetching image for: {url}"):
-                filename, path = fetch_profile_image(url)
+        with st.spinner(f"Fetching {len(urls)} profile image(s)..."):
+            # Most lookups never leave plain HTTP; the driver pool itself caps how many use a
+            # browser at once. Results still arrive in input order.
+            results = fetch_matrix(urls, ["linkedin"], lambda url, _: fetch_profile_image(url), concurrency=DEFAULT_CONCURRENCY)
+            for url, _, (filename, path) in results:
                 if filename:
                     filepaths.append(path)
-                    st.image(path, caption=filename, width=200)
+                    st.image(gallery_image(path), caption=filename, width=200)
                 else:
                     st.warning(f"❌ Failed to fetch image for: {url}")
-        st.session_state.linkedin_filepaths = filepaths
+                refresh_metrics()
+        st.session_state.linkedin_filepaths = normalize_batch(filepaths)
 
 # Always display previously fetched LinkedIn images and ZIP download
 if st.session_state.linkedin_filepaths:
     st.markdown("### Previously Fetched LinkedIn Images")
     for path in st.session_state.linkedin_filepaths:
-        st.image(path, caption=os.path.basename(path), width=200)
-    zip_file = zip_images(st.session_state.linkedin_filepaths)
-    st.download_button(
-        label="⬇️ Download All Images as ZIP",
-        data=zip_file,
+        st.image(gallery_image(path), caption=os.path.basename(path), width=200)
+    widgets.zip_download_button(
+        "⬇️ Download All Images as ZIP",
+        st.session_state.linkedin_filepaths,
+        SAVE_FOLDER,
         file_name="linkedin_profile_images.zip",
-        mime="application/zip"
     )
 
 # ==== Substack UI ====
@@ -285,21 +228,20 @@ if start_substack:
                 filename, path = fetch_substack_profile_image(url)
                 if filename:
                     substack_filepaths.append(path)
-                    st.image(path, caption=filename, width=200)
+                    st.image(gallery_image(path), caption=filename, width=200)
                 else:
                     st.warning(f"❌ Failed to fetch image for: {url}")
-        st.session_state.substack_filepaths = substack_filepaths
+        st.session_state.substack_filepaths = normalize_batch(substack_filepaths)
 
 if st.session_state.substack_filepaths:
     st.markdown("### Previously Fetched Substack Images")
     for path in st.session_state.substack_filepaths:
-        st.image(path, caption=os.path.basename(path), width=200)
-    zip_file = zip_images(st.session_state.substack_filepaths)
-    st.download_button(
-        label="⬇️ Download All Substack Images as ZIP",
-        data=zip_file,
+        st.image(gallery_image(path), caption=os.path.basename(path), width=200)
+    widgets.zip_download_button(
+        "⬇️ Download All Substack Images as ZIP",
+        st.session_state.substack_filepaths,
+        SAVE_FOLDER,
         file_name="substack_profile_images.zip",
-        mime="application/zip"
     )
 
 # ==== Medium UI ====
@@ -335,21 +277,20 @@ if start_medium:
                 filename, path = fetch_medium_profile_image(url)
                 if filename:
                     medium_filepaths.append(path)
-                    st.image(path, caption=filename, width=200)
+                    st.image(gallery_image(path), caption=filename, width=200)
                 else:
                     st.warning(f"❌ Failed to fetch image for: {url}")
-        st.session_state.medium_filepaths = medium_filepaths
+        st.session_state.medium_filepaths = normalize_batch(medium_filepaths)
 
 if st.session_state.medium_filepaths:
     st.markdown("### Previously Fetched Medium Images")
     for path in st.session_state.medium_filepaths:
-        st.image(path, caption=os.path.basename(path), width=200)
-    zip_file = zip_images(st.session_state.medium_filepaths)
-    st.download_button(
-        label="⬇️ Download All Medium Images as ZIP",
-        data=zip_file,
+        st.image(gallery_image(path), caption=os.path.basename(path), width=200)
+    widgets.zip_download_button(
+        "⬇️ Download All Medium Images as ZIP",
+        st.session_state.medium_filepaths,
+        SAVE_FOLDER,
         file_name="medium_profile_images.zip",
-        mime="application/zip"
     )
 
 # ==== DuckDuckGo Images UI ====
@@ -366,40 +307,46 @@ if "ddg_filepaths" not in st.session_state:
     st.session_state.ddg_filepaths = []
 
 if start_ddg:
-    queries = [query.strip() for query in input_queries.strip().splitlines() if query.strip()]
+    queries = list(dict.fromkeys(query.strip() for query in input_queries.strip().splitlines() if query.strip()))
     if not queries:
         st.warning("Please enter at least one query.")
     else:
         ddg_filepaths = []
-        for query in queries:
-            with st.spinner(f"Fetching images for query: {query}"):
-                with DDGS() as ddgs:
-                    for r in ddgs.images(query, max_results=max_results):
-                        img_url = r.get("image")
-                        if img_url:
-                            try:
-                                img_response = requests.get(img_url, timeout=10)
-                                if img_response.status_code == 200:
-                                    # Create a safe filename
-                                    filename = f"ddg_{int(time.time())}.jpg"
-                                    filepath = os.path.join(SAVE_FOLDER, filename)
-                                    with open(filepath, "wb") as f:
-                                        f.write(img_response.content)
-                                    ddg_filepaths.append(filepath)
-                                    st.image(filepath, caption=filename, width=200)
-                            except Exception as e:
-                                st.warning(f"❌ Failed to download image: {img_url}")
-        st.session_state.ddg_filepaths = ddg_filepaths
+        # One progress counter per query, advanced as its downloads finish in any order.
+        progress_bars = {query: st.progress(0.0, text=f"Searching images for: {query}") for query in queries}
+        for event in image_search.fetch_images(queries, max_results=max_results, save_folder=SAVE_FOLDER):
+            query = event["query"]
+            if event["filepath"]:
+                # The same picture found twice has the same name; show it once.
+                if event["filepath"] not in ddg_filepaths:
+                    ddg_filepaths.append(event["filepath"])
+                    st.image(gallery_image(event["filepath"]), caption=event["filename"], width=200)
+            elif event["error"]:
+                if event["image_url"]:
+                    st.warning(f"❌ Failed to download image: {event['image_url']}")
+                else:
+                    st.warning(f"❌ Image search failed for query: {query}")
+            checked = f"{event['done']}/{event['total']}"
+            progress_bars[query].progress(
+                event["done"] / event["total"] if event["total"] else 1.0,
+                text=f"**{query}**: {checked} checked, {event['saved']} saved",
+            )
+            refresh_metrics()
+        st.session_state.ddg_filepaths = normalize_batch(ddg_filepaths)
 
 # Always display previously fetched DDG images and ZIP download
 if st.session_state.ddg_filepaths:
     st.markdown("### Previously Fetched DDG Images")
     for path in st.session_state.ddg_filepaths:
-        st.image(path, caption=os.path.basename(path), width=200)
-    zip_file = zip_images(st.session_state.ddg_filepaths)
-    st.download_button(
-        label="⬇️ Download All DDG Images as ZIP",
-        data=zip_file,
+        st.image(gallery_image(path), caption=os.path.basename(path), width=200)
+    widgets.zip_download_button(
+        "⬇️ Download All DDG Images as ZIP",
+        st.session_state.ddg_filepaths,
+        SAVE_FOLDER,
         file_name="ddg_images.zip",
-        mime="application/zip"
-    )
\ No newline at end of file
+    )
+
+connection_stats_slot.json(http_client.connection_stats())
+rate_limit_slot.json(ratelimit.stats())
+tier_stats_slot.json(tier_stats())
+refresh_metrics(force=True)
@@ -1,9 +1,32 @@
+import os
+import sys
+import uuid
 import streamlit as st
-from PyPDF2 import PdfReader, PdfWriter
-from io import BytesIO
-from bs4 import BeautifulSoup
-# Ensure the required packages are installed
-# !pip install PyPDF2 streamlit beautifulsoup4
+
+# Make the shared `collector` package importable when launched via `streamlit run`.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from collector.pdf_split import (
+    PDF_CACHE_DIR, PdfDocument, content_hash, parse_ranges, prune_cache, split_to_zip, spool_upload,
+)
+
+BATCH_DIR = os.path.join(PDF_CACHE_DIR, "batches")
+SPLIT_DIR = os.path.join(PDF_CACHE_DIR, "splits")
+
+# Parsed documents are shared by every session, keyed by upload content, so reruns
+# (each change to the number input) and re-uploads of the same file skip the parse.
+# An evicted document is closed, which unmaps its file.
+@st.cache_resource(show_spinner="Reading PDF...", max_entries=16, on_release=PdfDocument.close)
+def load_pdf(digest, _data):
+    # A new upload is about to be spooled: make room for it first.
+    prune_cache()
+    return PdfDocument.from_bytes(_data, digest)
+
+def upload_digest(uploaded_file):
+    """The content hash of an upload, computed once per upload rather than on every rerun."""
+    digests = st.session_state.setdefault("pdf_digests", {})
+    if uploaded_file.file_id not in digests:
+        digests[uploaded_file.file_id] = content_hash(uploaded_file.getvalue())
+    return digests[uploaded_file.file_id]
 
 st.set_page_config(page_title="PDF Splitter Agent", layout="centered")
 
@@ -14,31 +37,70 @@ uploaded_file = st.file_uploader("Upload your PDF", type=["pdf"])
 
 if uploaded_file:
     st.success("PDF uploaded successfully.")
-    
-    reader = PdfReader(uploaded_file)
-    total_pages = len(reader.pages)
-    
+
+    document = load_pdf(upload_digest(uploaded_file), uploaded_file.getvalue())
+    total_pages = document.page_count
+
     st.info(f"Total pages in uploaded PDF: **{total_pages}**")
-    
-    num_pages = st.number_input("Enter number of pages to keep from the start:", 
-                                min_value=1, 
-                                max_value=total_pages, 
-                                value=2)
-    
+
+    num_pages = st.number_input("Enter number of pages to keep from the start:",
+                                min_value=1,
+                                max_value=total_pages,
+                                value=min(2, total_pages))
+
     if st.button("✂️ Split PDF"):
-        writer = PdfWriter()
-        
-        for i in range(num_pages):
-            writer.add_page(reader.pages[i])
-        
-        output_pdf = BytesIO()
-        writer.write(output_pdf)
-        output_pdf.seek(0)
-        
-        st.success(f"Successfully split first {num_pages} page(s)!")
-        st.download_button(
-            label="📥 Download Split PDF",
-            data=output_pdf,
-            file_name=f"split_first_{num_pages}_pages.pdf",
-            mime="application/pdf"
+        # Only the pages kept are loaded, and the output is written to disk (once per upload and page count).
+        split_path = document.save_pages(
+            range(num_pages), os.path.join(SPLIT_DIR, f"{upload_digest(uploaded_file)}_first_{num_pages}.pdf")
         )
+        with open(split_path, "rb") as output_pdf:
+            st.success(f"Successfully split first {num_pages} page(s)!")
+            st.download_button(
+                label="📥 Download Split PDF",
+                data=output_pdf,
+                file_name=f"split_first_{num_pages}_pages.pdf",
+                mime="application/pdf"
+            )
+
+# --- Batch Splitting ---
+st.markdown("---")
+st.title("🗂️ Batch PDF Splitter")
+st.markdown("Upload any number of PDFs and cut them all the same way. Every part of every file goes into one ZIP.")
+
+batch_files = st.file_uploader("Upload your PDFs", type=["pdf"], accept_multiple_files=True, key="batch_pdfs")
+expression = st.text_input(
+    "Pages to extract:",
+    value="every 10 pages",
+    help="Comma-separated pages and ranges, one part each (e.g. `1-3,7,20-`), or fixed-size chunks (`every 10 pages`).",
+)
+
+if batch_files and st.button("✂️ Split All PDFs"):
+    try:
+        parse_ranges(expression, 1)
+    except ValueError as e:
+        st.error(str(e))
+    else:
+        prune_cache()
+        # Uploads are handed to the workers as files on disk, never as bytes.
+        sources = [(f.name, spool_upload(f.getvalue(), upload_digest(f))) for f in batch_files]
+        # One archive per session, replaced by the next batch.
+        os.makedirs(BATCH_DIR, exist_ok=True)
+        zip_path = st.session_state.setdefault("pdf_batch_zip", os.path.join(BATCH_DIR, f"{uuid.uuid4().hex}.zip"))
+        progress = st.progress(0.0, text=f"Splitting {len(sources)} PDF(s)...")
+        part_count = 0
+        for done, result in enumerate(split_to_zip(sources, expression, zip_path), start=1):
+            if result["error"]:
+                st.warning(f"❌ {result['name']}: {result['error']}")
+            part_count += len(result["parts"])
+            progress.progress(done / len(sources), text=f"Split **{result['name']}** ({done}/{len(sources)})")
+        st.session_state.pdf_batch_parts = part_count
+
+if st.session_state.get("pdf_batch_parts") and os.path.exists(st.session_state.pdf_batch_zip):
+    st.success(f"{st.session_state.pdf_batch_parts} part(s) ready.")
+    st.download_button(
+        label="📥 Download All Parts as ZIP",
+        # Deferred: the archive is only opened when the button is clicked
+        data=lambda path=st.session_state.pdf_batch_zip: open(path, "rb"),
+        file_name="split_pdfs.zip",
+        mime="application/zip"
+    )
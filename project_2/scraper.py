@@ -1,76 +1,23 @@
 import os
-import io
-import requests
-from urllib.parse import urljoin, urlparse
+import sys
 import streamlit as st
-from bs4 import BeautifulSoup
-from zipfile import ZipFile
-from duckduckgo_search import DDGS
+
+# Make the shared `collector` package importable when launched via `streamlit run`.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from collector import http_client, metrics_panel, normalize, profiles, ratelimit, widgets
+from collector.miss_cache import get_miss_cache
+from collector.search_cache import get_search_cache
 
 # --- Constants and Setup ---
 SAVE_FOLDER = "images"
 os.makedirs(SAVE_FOLDER, exist_ok=True)
 
-# IMPROVEMENT 4: Add a User-Agent to mimic a browser and prevent blocking.
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-}
-
-# IMPROVEMENT 1: Centralized configuration for platforms. Makes adding new platforms trivial.
-PLATFORMS = {
-    "substack": {
-        "url_template": lambda user: f"https://{user}.substack.com",
-        "username_parser": lambda url: url.netloc.split('.')[0]
-    },
-    "medium": {
-        "url_template": lambda user: f"https://medium.com/@{user.strip('@')}",
-        "username_parser": lambda url: url.path.strip('/').replace('@', '')
-    }
-    # To add another platform, just add an entry here!
-}
-
 # --- Core Functions ---
 
-def _extract_image_from_html(soup, base_url):
-    """A robust, unified function to find the best profile image from page HTML."""
-    # Priority: Open Graph -> Twitter Card -> Specific class -> Favicon
-    og_image = soup.find("meta", property="og:image")
-    if og_image and og_image.get("content"):
-        return urljoin(base_url, og_image["content"])
-
-    twitter_image = soup.find("meta", property="twitter:image")
-    if twitter_image and twitter_image.get("content"):
-        return urljoin(base_url, twitter_image["content"])
-
-    profile_img = soup.find("img", class_=lambda x: x and "profile-image" in x)
-    if profile_img and profile_img.get("src"):
-        return urljoin(base_url, profile_img["src"])
-
-    icon_link = soup.find("link", rel="icon")
-    if icon_link and icon_link.get("href"):
-        return urljoin(base_url, icon_link["href"])
-
-    return None
-
-@st.cache_data(show_spinner=False)
-def find_profile_url_with_search(query, platform_name):
-    """Uses DuckDuckGo to find a profile URL with a general search query."""
-    st.info(f"Searching the web for '{query}' on {platform_name}...")
-    site_domain = f"{platform_name.lower()}.com"
-    try:
-        search_query = f'"{query}" {platform_name} author profile'
-        with DDGS() as ddgs:
-            results = list(ddgs.text(search_query, max_results=5))
-            for result in results:
-                url = result.get('href')
-                if url and site_domain in urlparse(url).netloc:
-                    st.success(f"Found potential profile: {url}")
-                    return url
-    except Exception as e:
-        st.warning(f"Web search encountered an error: {e}")
-
-    st.warning(f"Could not find a likely profile for '{query}' in search results.")
-    return None
+def show_event(level, message):
+    """Shows a lookup event from ``collector.profiles``; step-by-step debug detail is left out."""
+    if level != "debug":
+        getattr(st, level)(message)
 
 # IMPROVEMENT 2: Cache the entire function for efficiency on repeated searches.
 @st.cache_data(show_spinner=False)
@@ -79,78 +26,19 @@ def fetch_profile_image(user_input, platform):
     Fetches and saves a profile image for a given user and platform.
     Returns a dictionary with image info or None on failure.
     """
-    profile_url = None
-    platform_config = PLATFORMS.get(platform)
-    if not platform_config:
-        st.error(f"Configuration for platform '{platform}' not found.")
-        return None
-
-    if user_input.startswith("http"):
-        # Only process if the URL seems to belong to the selected platform
-        if platform in urlparse(user_input).netloc:
-             profile_url = user_input
-        else:
-            return None # Skip if URL doesn't match platform
-    else:
-        profile_url = platform_config["url_template"](user_input)
-
-    try:
-        response = requests.get(profile_url, timeout=10, allow_redirects=True, headers=HEADERS)
-        final_url = response.url
-
-        if response.status_code != 200:
-            found_url = find_profile_url_with_search(user_input, platform.capitalize())
-            if found_url:
-                response = requests.get(found_url, timeout=10, allow_redirects=True, headers=HEADERS)
-                final_url = response.url
-            else:
-                return None
-
-        response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
+    return profiles.fetch_profile(user_input, platform, SAVE_FOLDER, on_event=show_event)
 
-        soup = BeautifulSoup(response.text, "html.parser")
-        img_url = _extract_image_from_html(soup, final_url)
-
-        if not img_url:
-            return None
-
-        img_response = requests.get(img_url, timeout=10, headers=HEADERS)
-        img_response.raise_for_status()
-
-        # Use the platform-specific parser from the config
-        parsed_url = urlparse(final_url)
-        username = platform_config["username_parser"](parsed_url)
-
-        filename = f"{platform}_{username}.jpg"
-        filepath = os.path.join(SAVE_FOLDER, filename)
-
-        with open(filepath, "wb") as f:
-            f.write(img_response.content)
-            
-        return {
-            "path": filepath,
-            "filename": filename,
-            "source_url": final_url
-        }
-
-    except requests.RequestException as e:
-        st.error(f"A network error occurred for {profile_url}: {e}")
-        return None
-
-def zip_images(results_dict):
-    """Creates a ZIP file in memory from a list of result dictionaries."""
-    zip_buffer = io.BytesIO()
-    filepaths_to_zip = set() # Use a set to avoid duplicates
-    
-    for query_results in results_dict.values():
-        for result in query_results:
-             filepaths_to_zip.add(result["path"])
-
-    with ZipFile(zip_buffer, "w") as zip_file:
-        for path in filepaths_to_zip:
-            zip_file.write(path, arcname=os.path.basename(path))
-    zip_buffer.seek(0)
-    return zip_buffer
+def normalize_results(results):
+    """Normalizes the images of a finished batch of lookups, updating each result's file name."""
+    reports = list(normalize.normalize_images([r["filepath"] for r in results], SAVE_FOLDER, **normalize_settings))
+    renamed = {report["source"]: report["filepath"] for report in reports}
+    for result in results:
+        result["filepath"] = renamed.get(result["filepath"], result["filepath"])
+        result["filename"] = os.path.basename(result["filepath"])
+    if any(report["filepath"] != report["source"] for report in reports):
+        # Cached lookups still name the files that were just replaced.
+        fetch_profile_image.clear()
+    st.caption(f"🗜️ {normalize.describe(normalize.summarize(reports))}")
 
 
 # --- Streamlit UI ---
@@ -158,6 +46,14 @@ st.set_page_config(page_title="Profile Image Finder", layout="wide")
 st.title("Profile Image Finder 🕵️‍♂️")
 st.markdown("Enter names, usernames, or full profile URLs. The app will search for them on the selected platforms.")
 
+gallery_image = widgets.gallery_toggle(SAVE_FOLDER)
+
+# Live stage timings and counters of this server process, redrawn while lookups run.
+refresh_metrics = metrics_panel.sidebar()
+
+# Saved images are re-encoded to one real format and size after each batch, on a process pool.
+normalize_settings = widgets.normalize_settings()
+
 # Initialize session state
 if "results" not in st.session_state:
     st.session_state.results = {}
@@ -175,8 +71,8 @@ with c1:
 with c2:
     selected_platforms_display = st.multiselect(
         "Select platforms to search on:",
-        [p.capitalize() for p in PLATFORMS.keys()],
-        default=[p.capitalize() for p in PLATFORMS.keys()]
+        [p.capitalize() for p in profiles.PLATFORMS.keys()],
+        default=[p.capitalize() for p in profiles.PLATFORMS.keys()]
     )
     selected_platforms = [p.lower() for p in selected_platforms_display]
 
@@ -186,7 +82,7 @@ with c2:
 
 if clear_button:
     st.session_state.results = {}
-    st.experimental_rerun()
+    st.rerun()
 
 if fetch_button:
     queries = [line.strip() for line in user_inputs.strip().splitlines() if line.strip()]
@@ -196,6 +92,7 @@ if fetch_button:
     elif not selected_platforms:
         st.warning("Please select at least one platform to search.")
     else:
+        new_results = []
         for query in queries:
             if query not in st.session_state.results:
                  st.session_state.results[query] = []
@@ -206,14 +103,28 @@ if fetch_button:
                     result_info = fetch_profile_image(query, platform)
                     if result_info:
                         # Avoid adding duplicate results for the same query
-                        if not any(r['path'] == result_info['path'] for r in st.session_state.results[query]):
+                        if not any(r['filepath'] == result_info['filepath'] for r in st.session_state.results[query]):
                             st.session_state.results[query].append(result_info)
+                            new_results.append(result_info)
                         found_on_any_platform = True
+                    refresh_metrics()
                 
                 if not found_on_any_platform:
                     # To show that a search was attempted but failed
                     if not st.session_state.results[query]:
                          st.session_state.results[query] = "failed"
+        if normalize_settings and new_results:
+            normalize_results(new_results)
+
+with st.sidebar.expander("🔌 Connection reuse"):
+    st.json(http_client.connection_stats())
+with st.sidebar.expander("🔎 Search cache"):
+    st.json(get_search_cache().stats())
+with st.sidebar.expander("🚫 Known misses"):
+    st.json(get_miss_cache().stats())
+with st.sidebar.expander("🚦 Rate limits"):
+    st.json(ratelimit.stats())
+refresh_metrics(force=True)
 
 
 if st.session_state.results:
@@ -236,15 +147,16 @@ if st.session_state.results:
             for idx, result in enumerate(results):
                 all_found_results.append(result)
                 with cols[idx % 4]:
-                    st.image(result["path"], caption=result['filename'])
-                    st.markdown(f"[Source]({result['source_url']})")
+                    st.image(gallery_image(result["filepath"]), caption=result['filename'])
+                    st.markdown(f"[Source]({result['profile_url']})")
+                    if result.get("near_duplicate_of"):
+                        st.caption(f"⚠️ Near-duplicate of {result['near_duplicate_of']}")
 
     if all_found_results:
-        zip_file = zip_images(st.session_state.results)
-        st.download_button(
+        widgets.zip_download_button(
             "⬇️ Download All as ZIP",
-            data=zip_file,
+            [result["filepath"] for result in all_found_results],
+            SAVE_FOLDER,
             file_name="profile_images.zip",
-            mime="application/zip",
         )
     
\ No newline at end of file